@@ -0,0 +1,85 @@
+import io
+import tarfile
+import threading
+import time
+
+import soundfile
+
+
+class ArchiveWriter:
+    # Packs encoded clips into an uncompressed tar archive, one member <name>_<i>.<ext> per clip, as in a WebDataset
+    # shard. Members are written in order as they come, so the archive can be streamed by tar tools and loaders.
+    def __init__(self, path):
+        self.path = path
+        self.tar = tarfile.open(path, 'w', format=tarfile.PAX_FORMAT)
+        self.mtime = time.time()
+
+    def add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ClipArchive:
+    # Random access to the clips of an archive written by ArchiveWriter. The offsets of the members are read from
+    # their headers once; a clip is then read with a single seek, by its id (the member name without extension,
+    # i.e. <name>_<i>) or its index. Reads are thread-safe.
+    def __init__(self, path):
+        self.path = path
+        self.members = {}
+        with tarfile.open(path, 'r:') as tar:
+            for member in tar:
+                if member.isfile():
+                    self.members[member.name.rsplit('.', maxsplit=1)[0]] = (member.name, member.offset_data,
+                                                                            member.size)
+        self.ids = list(self.members)
+        self.file = open(path, 'rb')
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, clip_id):
+        return clip_id in self.members
+
+    def _member(self, clip):
+        if isinstance(clip, int):
+            clip = self.ids[clip]
+        return self.members[clip]
+
+    def read_bytes(self, clip):
+        # Encoded clip, as written to the archive.
+        _, offset, size = self._member(clip)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(size)
+
+    def read(self, clip, dtype='float32', always_2d=False):
+        # Decoded clip and its sample rate, like soundfile.read().
+        return soundfile.read(io.BytesIO(self.read_bytes(clip)), dtype=dtype, always_2d=always_2d)
+
+    def __iter__(self):
+        # (id, audio, sr) of each clip in order.
+        for clip_id in self.ids:
+            audio, sr = self.read(clip_id)
+            yield clip_id, audio, sr
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,154 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import multiprocessing
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TARGETS = ['get_rms', 'get_rms_sliding', 'slicer2', 'slicer']
+
+
+def make_signal(seconds, sr, channels, seed=0):
+    # Deterministic speech-like signal: bursts of modulated noise ("utterances") separated by pauses of
+    # various lengths, on top of a faint noise floor. Generated piece by piece to keep temporaries small.
+    rng = np.random.default_rng(seed)
+    num_samples = int(seconds * sr)
+    waveform = np.empty((channels, num_samples), dtype=np.float32)
+    pos = 0
+    while pos < num_samples:
+        speech = min(num_samples - pos, int(rng.uniform(0.3, 8.) * sr))
+        pause = min(num_samples - pos - speech, int(rng.choice([0.05, 0.2, 0.5, 1., 3.]) * rng.uniform(0.5, 1.5) * sr))
+        t = np.arange(speech, dtype=np.float32) / sr
+        syllables = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3., 6.) * t)
+        waveform[:, pos: pos + speech] = rng.standard_normal((channels, speech), dtype=np.float32) \
+            * (rng.uniform(0.05, 0.5) * syllables)
+        waveform[:, pos + speech: pos + speech + pause] = \
+            rng.standard_normal((channels, pause), dtype=np.float32) * 1e-4
+        pos += speech + pause
+    return waveform[0] if channels == 1 else waveform
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+
+def run_case(target, seconds, sr, channels, seed):
+    # Runs in a fresh process so that the peak RSS belongs to this case only.
+    waveform = make_signal(seconds, sr, channels, seed=seed)
+    if target == 'slicer':
+        import slicer
+        func = slicer.Slicer(sr=sr).slice
+    else:
+        import slicer2
+        slicer2_slicer = slicer2.Slicer(sr=sr, hop_size=10, max_sil_kept=500)
+        if target == 'slicer2':
+            func = slicer2_slicer.slice
+        else:
+            samples = waveform.mean(axis=0) if channels > 1 else waveform
+            method = 'sliding' if target == 'get_rms_sliding' else 'strided'
+
+            def func(_):
+                return slicer2.get_rms(samples, frame_length=slicer2_slicer.win_size,
+                                       hop_length=slicer2_slicer.hop_size, method=method)
+    baseline_rss = _peak_rss_mb()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    func(waveform)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    peak_rss = _peak_rss_mb()
+    return {
+        'target': target,
+        'seconds': seconds,
+        'sr': sr,
+        'channels': channels,
+        'wall': wall,
+        'cpu': cpu,
+        'throughput': seconds / cpu if cpu > 0 else None,
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    # Print the throughput of each case relative to the baseline; < 1 means slower than the baseline.
+    key = lambda r: (r['target'], r['seconds'], r['sr'], r['channels'])
+    old = {key(r): r for r in baseline['results']}
+    for result in results['results']:
+        before = old.get(key(result))
+        if before is None or not before['throughput'] or not result['throughput']:
+            continue
+        print('%-16s %8ds %6dHz %dch  throughput x%.2f' % (
+            *key(result), result['throughput'] / before['throughput']))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the slicing engines on synthetic audio')
+    parser.add_argument('--targets', type=str, nargs='+', default=['get_rms', 'get_rms_sliding', 'slicer2'],
+                        choices=TARGETS, help='What to time; "slicer" (v1) is slow on long audio')
+    parser.add_argument('--durations', type=float, nargs='+', default=[60, 600, 3600],
+                        help='Lengths of the synthetic audio in seconds, e.g. 14400 for 4 hours')
+    parser.add_argument('--sample_rates', type=int, nargs='+', default=[16000, 44100])
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--repeat', type=int, default=1, help='Keep the best of this many runs of each case')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, help='Compare the throughput with a previous JSON result')
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for target in args.targets:
+        for seconds in args.durations:
+            for sr in args.sample_rates:
+                for channels in args.channels:
+                    best = None
+                    for _ in range(args.repeat):
+                        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                            result = executor.submit(run_case, target, seconds, sr, channels, args.seed).result()
+                        if best is None or result['cpu'] < best['cpu']:
+                            best = result
+                    results.append(best)
+                    print('%-16s %8ds %6dHz %dch  cpu %8.3fs  %10.1fx real-time  peak RSS %s MB' % (
+                        target, seconds, sr, channels, best['cpu'], best['throughput'] or float('inf'),
+                        'n/a' if best['peak_rss_mb'] is None else '%.0f' % best['peak_rss_mb']))
+
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'results': results,
+    }
+    if args.out is not None:
+        with open(args.out, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
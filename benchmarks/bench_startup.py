@@ -0,0 +1,92 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import soundfile
+
+from bench_slicers import ROOT, make_signal, _git_commit
+
+CASES = ['slicer2_help', 'slicer_help', 'slicer2_slice', 'slicer_slice', 'gui_import']
+
+
+def _command(case, audio, out):
+    if case == 'slicer2_help':
+        return [sys.executable, 'slicer2.py', '--help']
+    if case == 'slicer_help':
+        return [sys.executable, 'slicer.py', '--help']
+    if case == 'slicer2_slice':
+        return [sys.executable, 'slicer2.py', audio, '--out', out]
+    if case == 'slicer_slice':
+        return [sys.executable, 'slicer.py', audio, '--out', out]
+    return [sys.executable, '-c', 'import gui.mainwindow']
+
+
+def run_case(case, audio, out, repeat):
+    # Wall time of a fresh interpreter running the command, which is dominated by imports for short audio.
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run(_command(case, audio, out), cwd=ROOT, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        wall = time.perf_counter() - start
+        if completed.returncode != 0:
+            return {'case': case, 'error': completed.stderr.decode(errors='replace').strip().splitlines()[-1]}
+        times.append(wall)
+    return {'case': case, 'min': min(times), 'median': statistics.median(times)}
+
+
+def compare(baseline, results):
+    # Print the median start time of each case relative to the baseline; > 1 means slower than the baseline.
+    old = {r['case']: r for r in baseline['results']}
+    for result in results['results']:
+        before = old.get(result['case'])
+        if before is None or 'median' not in before or 'median' not in result:
+            continue
+        print('%-16s  start time x%.2f' % (result['case'], result['median'] / before['median']))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the start time of the command line tools and the GUI')
+    parser.add_argument('--cases', type=str, nargs='+', default=CASES, choices=CASES)
+    parser.add_argument('--seconds', type=float, default=10,
+                        help='Length of the synthetic audio sliced by the *_slice cases')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs of each case')
+    parser.add_argument('--out', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--compare', type=str, help='Compare the start times with a previous JSON result')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        audio = os.path.join(temp_dir, 'audio.wav')
+        soundfile.write(audio, make_signal(args.seconds, 44100, 1), 44100)
+        for case in args.cases:
+            result = run_case(case, audio, os.path.join(temp_dir, 'out'), args.repeat)
+            results.append(result)
+            if 'error' in result:
+                print('%-16s  failed: %s' % (case, result['error']))
+            else:
+                print('%-16s  min %6.3fs  median %6.3fs' % (case, result['min'], result['median']))
+
+    report = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.out is not None:
+        with open(args.out, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf8') as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_slicers import make_signal
+
+
+def random_envelope(rng, num_frames, threshold):
+    # RMS frames alternating between sound and silence runs of random lengths, including runs at both ends and runs
+    # of a single frame, with ties inside the silences so that the first minimum must be picked.
+    rms_list = np.empty(num_frames, dtype=np.float32)
+    pos = 0
+    silent = rng.random() < 0.5
+    while pos < num_frames:
+        length = min(num_frames - pos, int(rng.choice([1, 2, 5, 20, 50, 200])) * int(rng.integers(1, 4)))
+        if silent:
+            rms_list[pos: pos + length] = threshold * rng.choice([0.1, 0.5, 0.9], size=length)
+        else:
+            rms_list[pos: pos + length] = threshold * rng.uniform(1., 100., size=length)
+        pos += length
+        silent = not silent
+    return rms_list
+
+
+def random_slicer_kwargs(rng):
+    hop_size = int(rng.choice([5, 10, 20]))
+    min_interval = hop_size * int(rng.integers(1, 40))
+    return {
+        'threshold': float(rng.choice([-50., -40., -30.])),
+        'min_length': min_interval * int(rng.integers(1, 20)),
+        'min_interval': min_interval,
+        'hop_size': hop_size,
+        'max_sil_kept': hop_size * int(rng.integers(1, 60)),
+    }
+
+
+def check(cases, seed):
+    # Compares the clips of the backends on random envelopes and random parameters, then on synthetic speech.
+    from slicer2 import BACKENDS, Slicer
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for case in range(cases):
+        kwargs = random_slicer_kwargs(rng)
+        slicers = [Slicer(sr=1000, backend=backend, **kwargs) for backend in BACKENDS]
+        num_frames = int(rng.integers(1, 5000))
+        rms_list = random_envelope(rng, num_frames, slicers[0].threshold)
+        num_samples = num_frames * slicers[0].hop_size - int(rng.integers(0, slicers[0].hop_size))
+        boundaries = [slicer.get_boundaries_from_rms(rms_list, num_samples) for slicer in slicers]
+        if any(b != boundaries[0] for b in boundaries[1:]):
+            failures += 1
+            print(f'case {case}: {kwargs}, {num_frames} frames: backends differ')
+    for seconds, sr in ((60, 16000), (600, 44100)):
+        waveform = make_signal(seconds, sr, 1, seed=seed)
+        boundaries = [Slicer(sr=sr, backend=backend).get_boundaries(waveform) for backend in BACKENDS]
+        if any(b != boundaries[0] for b in boundaries[1:]):
+            failures += 1
+            print(f'{seconds}s at {sr} Hz: backends differ')
+    return failures
+
+
+def bench(seconds, sr, repeat):
+    # Time of the state machine alone on the envelope of synthetic speech, after compiling.
+    from slicer2 import BACKENDS, Slicer, get_rms
+    waveform = make_signal(seconds, sr, 1)
+    for backend in BACKENDS:
+        slicer = Slicer(sr=sr, hop_size=10, max_sil_kept=500, backend=backend)
+        rms_list = get_rms(waveform, frame_length=slicer.win_size, hop_length=slicer.hop_size).squeeze(0)
+        start = time.perf_counter()
+        slicer.get_boundaries_from_rms(rms_list, waveform.shape[0])
+        first = time.perf_counter() - start
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            slicer.get_boundaries_from_rms(rms_list, waveform.shape[0])
+            times.append(time.perf_counter() - start)
+        print('%-6s %8ds  first call %8.4fs  state machine %8.4fs' % (slicer.backend, seconds, first, min(times)))
+
+
+def main():
+    parser = ArgumentParser(description='Check that the backends of the slicer state machine give the same clips on '
+                                        'randomized signals, and time them')
+    parser.add_argument('--cases', type=int, default=500, help='Number of random envelopes and parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=3600, help='Length of the synthetic audio that is timed')
+    parser.add_argument('--repeat', type=int, default=5, help='Keep the best of this many runs')
+    args = parser.parse_args()
+    failures = check(args.cases, args.seed)
+    print(f'{args.cases} random cases: {failures} failed')
+    bench(args.seconds, 44100, args.repeat)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_slicers import make_signal
+from check_streaming import random_waveform, same_clips
+
+
+def loop_slice(slicer, audio):
+    # The per-silence loop of the original slicer.Slicer.slice(), kept as the reference of Slicer._get_sil_tags() and
+    # _window_rms_argmin().
+    from slicer import _apply_slice, _window_maximum, _window_rms, level2db
+    if len(audio.shape) > 1:
+        samples = np.mean(audio, axis=0)
+    else:
+        samples = audio
+    if samples.shape[0] <= slicer.min_samples:
+        return [audio]
+    # get absolute amplitudes
+    abs_amp = np.abs(samples - np.mean(samples))
+    # calculate local maximum with large window
+    win_max_db = level2db(_window_maximum(abs_amp, win_sz=slicer.win_ln))
+    sil_tags = []
+    left = right = 0
+    while right < win_max_db.shape[0]:
+        if win_max_db[right] < slicer.db_threshold:
+            right += 1
+        elif left == right:
+            left += 1
+            right += 1
+        else:
+            if left == 0:
+                split_loc_l = left
+            else:
+                sil_left_n = min(slicer.max_silence, (right + slicer.win_ln - left) // 2)
+                rms_db_left = level2db(_window_rms(samples[left: left + sil_left_n], win_sz=slicer.win_sn))
+                split_win_l = left + np.argmin(rms_db_left)
+                split_loc_l = split_win_l + np.argmin(abs_amp[split_win_l: split_win_l + slicer.win_sn])
+            if len(sil_tags) != 0 and split_loc_l - sil_tags[-1][1] < slicer.min_samples \
+                    and right < win_max_db.shape[0] - 1:
+                right += 1
+                left = right
+                continue
+            if right == win_max_db.shape[0] - 1:
+                split_loc_r = right + slicer.win_ln
+            else:
+                sil_right_n = min(slicer.max_silence, (right + slicer.win_ln - left) // 2)
+                rms_db_right = level2db(_window_rms(samples[right + slicer.win_ln - sil_right_n: right + slicer.win_ln],
+                                                    win_sz=slicer.win_sn))
+                split_win_r = right + slicer.win_ln - sil_right_n + np.argmin(rms_db_right)
+                split_loc_r = split_win_r + np.argmin(abs_amp[split_win_r: split_win_r + slicer.win_sn])
+            sil_tags.append((split_loc_l, split_loc_r))
+            right += 1
+            left = right
+    if left != right:
+        sil_left_n = min(slicer.max_silence, (right + slicer.win_ln - left) // 2)
+        rms_db_left = level2db(_window_rms(samples[left: left + sil_left_n], win_sz=slicer.win_sn))
+        split_win_l = left + np.argmin(rms_db_left)
+        split_loc_l = split_win_l + np.argmin(abs_amp[split_win_l: split_win_l + slicer.win_sn])
+        sil_tags.append((split_loc_l, samples.shape[0]))
+    if len(sil_tags) == 0:
+        return [audio]
+    chunks = []
+    if sil_tags[0][0] > 0:
+        chunks.append(_apply_slice(audio, 0, sil_tags[0][0]))
+    for i in range(0, len(sil_tags) - 1):
+        chunks.append(_apply_slice(audio, sil_tags[i][1], sil_tags[i + 1][0]))
+    if sil_tags[-1][1] < samples.shape[0] - 1:
+        chunks.append(_apply_slice(audio, sil_tags[-1][1], samples.shape[0]))
+    return chunks
+
+
+def random_legacy_kwargs(rng):
+    win_s = int(rng.choice([5, 10, 20]))
+    win_l = win_s * int(rng.integers(1, 40))
+    return {
+        'db_threshold': float(rng.choice([-50., -40., -30.])),
+        'min_length': win_l * int(rng.integers(1, 20)),
+        'win_l': win_l,
+        'win_s': win_s,
+        'max_silence_kept': win_s * int(rng.integers(1, 60)),
+    }
+
+
+def compare(slicer, audio):
+    # Whether Slicer.slice() gives the same chunks as the loop, or fails as well where the loop fails (on silences
+    # shorter than the small window).
+    try:
+        expected = loop_slice(slicer, audio)
+    except ValueError:
+        expected = None
+    try:
+        chunks = slicer.slice(audio)
+    except ValueError:
+        chunks = None
+    if expected is None or chunks is None:
+        return expected is None and chunks is None
+    return same_clips(chunks, expected)
+
+
+def check(cases, seed, paths):
+    # Compares the chunks of the legacy slicer with those of the loop on random signals and parameters, then on
+    # synthetic speech and on the given audio files.
+    from slicer import Slicer
+    from slicer2 import load_audio
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for case in range(cases):
+        kwargs = random_legacy_kwargs(rng)
+        channels = int(rng.choice([1, 2]))
+        audio = random_waveform(rng, int(rng.integers(0, 50000)), channels)
+        if not compare(Slicer(sr=1000, **kwargs), audio):
+            failures += 1
+            print(f'case {case}: {kwargs}, {channels} channels, {audio.shape[-1]} samples: chunks differ')
+    for seconds, sr, channels in ((60, 16000, 1), (120, 44100, 2)):
+        audio = make_signal(seconds, sr, channels, seed=seed)
+        for db_threshold in (-50., -40., -30.):
+            if not compare(Slicer(sr=sr, db_threshold=db_threshold), audio):
+                failures += 1
+                print(f'{seconds}s at {sr} Hz, {channels} channels, {db_threshold} dB: chunks differ')
+    for path in paths:
+        audio, sr = load_audio(path)
+        for db_threshold in (-50., -40., -30.):
+            if not compare(Slicer(sr=sr, db_threshold=db_threshold), audio):
+                failures += 1
+                print(f'{path}, {db_threshold} dB: chunks differ')
+    return failures
+
+
+def bench(seconds, sr):
+    # Time of the loop and of the vectorized legacy slicer on synthetic speech.
+    from slicer import Slicer
+    audio = make_signal(seconds, sr, 1)
+    slicer = Slicer(sr=sr)
+    for name, slice_audio in (('loop', lambda: loop_slice(slicer, audio)), ('numpy', lambda: slicer.slice(audio))):
+        start = time.perf_counter()
+        slice_audio()
+        print('%-6s %8ds  %8.4fs' % (name, seconds, time.perf_counter() - start))
+
+
+def main():
+    parser = ArgumentParser(description='Check that the vectorized legacy slicer gives the same chunks as the '
+                                        'original per-silence loop on randomized signals and audio files, and time '
+                                        'both')
+    parser.add_argument('audio', type=str, nargs='*', help='Audio files to check as well')
+    parser.add_argument('--cases', type=int, default=500, help='Number of random signals and parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=600, help='Length of the synthetic audio that is timed')
+    args = parser.parse_args()
+    failures = check(args.cases, args.seed, args.audio)
+    print(f'{args.cases} random cases: {failures} failed')
+    bench(args.seconds, 44100)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
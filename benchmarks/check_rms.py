@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_slicers import make_signal
+
+# Relative tolerance of the sliding RMS against the strided one, by dtype of the signal. The strided RMS averages
+# the squares in the dtype of the signal, the sliding one sums them in float64.
+TOLERANCES = {np.dtype(np.float32): 1e-5, np.dtype(np.float64): 1e-12}
+
+
+def random_signal(rng, num_samples, dtype):
+    # Noise of random levels, with runs of exact zeros and of a constant, in random lengths.
+    signal = np.empty(num_samples, dtype=np.float64)
+    pos = 0
+    while pos < num_samples:
+        length = min(num_samples - pos, int(rng.choice([1, 10, 100, 1000])) * int(rng.integers(1, 4)))
+        kind = rng.random()
+        if kind < 0.1:
+            signal[pos: pos + length] = 0.
+        elif kind < 0.2:
+            signal[pos: pos + length] = rng.uniform(-0.5, 0.5)
+        else:
+            signal[pos: pos + length] = rng.standard_normal(length) * 10 ** rng.uniform(-5, -0.5)
+        pos += length
+    return signal.astype(dtype)
+
+
+def check(cases, seed):
+    # Compares the sliding RMS with the strided one on random signals, frame lengths and hop lengths (including
+    # frames that are not a multiple of the hop, or shorter than it), and checks that the sliding frames do not
+    # depend on how they are split into blocks.
+    from slicer2 import _get_sliding_rms, get_rms
+    rng = np.random.default_rng(seed)
+    failures = 0
+    worst = 0.
+    for case in range(cases):
+        dtype = np.dtype(rng.choice([np.float32, np.float64]))
+        hop_length = int(rng.integers(1, 500))
+        frame_length = int(rng.choice([hop_length * int(rng.integers(1, 8)), int(rng.integers(1, 2000))]))
+        signal = random_signal(rng, int(rng.integers(0, 20000)), dtype)
+        strided = get_rms(signal, frame_length=frame_length, hop_length=hop_length)
+        sliding = get_rms(signal, frame_length=frame_length, hop_length=hop_length, method='sliding')
+        if strided.shape != sliding.shape:
+            failures += 1
+            print(f'case {case}: {dtype}, frame {frame_length}, hop {hop_length}: {sliding.shape} frames instead of '
+                  f'{strided.shape}')
+            continue
+        if strided.size == 0:
+            continue
+        # Relative to the loudest frame, as quiet frames next to loud ones inherit the rounding of the loud ones
+        error = float(np.abs(sliding.astype(np.float64) - strided).max() / max(float(strided.max()), 1e-30))
+        worst = max(worst, error)
+        if error > TOLERANCES[dtype]:
+            failures += 1
+            print(f'case {case}: {dtype}, frame {frame_length}, hop {hop_length}: relative error {error:.3g}')
+        padded = np.pad(signal, frame_length // 2)
+        blocks = _get_sliding_rms(padded, frame_length=frame_length, hop_length=hop_length,
+                                  block_frames=int(rng.integers(1, 50)))
+        if not np.array_equal(blocks, sliding):
+            failures += 1
+            print(f'case {case}: {dtype}, frame {frame_length}, hop {hop_length}: frames depend on the blocks')
+    print(f'{cases} random cases: worst relative error {worst:.3g}')
+    return failures
+
+
+def compare_clips(seconds, sr):
+    # Clips of the two methods on synthetic speech, which may only differ where a frame is within rounding of the
+    # threshold, and the time taken by each method.
+    from slicer2 import Slicer
+    waveform = make_signal(seconds, sr, 1)
+    boundaries = {}
+    for method in ('strided', 'sliding'):
+        slicer = Slicer(sr=sr, rms_method=method)
+        start = time.perf_counter()
+        boundaries[method] = slicer.get_boundaries(waveform)
+        print('%-8s %8ds  %5d clips  %8.4fs' % (method, seconds, len(boundaries[method]),
+                                                 time.perf_counter() - start))
+    if boundaries['strided'] != boundaries['sliding']:
+        print(f'{seconds}s at {sr} Hz: the clips of the two methods differ')
+
+
+def main():
+    parser = ArgumentParser(description='Check that the sliding RMS matches the strided RMS within rounding on '
+                                        'randomized signals, and compare the clips and the time of both')
+    parser.add_argument('--cases', type=int, default=1000, help='Number of random signals and frame parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=600, help='Length of the synthetic audio that is sliced')
+    args = parser.parse_args()
+    failures = check(args.cases, args.seed)
+    print(f'{args.cases} random cases: {failures} failed')
+    compare_clips(args.seconds, 44100)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
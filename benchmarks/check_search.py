@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_slicers import make_signal
+from check_backends import random_slicer_kwargs
+from check_streaming import random_waveform
+
+CHANNEL_POLICIES = ['mean', 'max', 0, 1]
+RMS_METHODS = ['strided', 'sliding']
+JOBS = [1, 2, None]
+
+
+def check(cases, seed):
+    # Compares the clips of the coarse to fine search with those of the exhaustive search on random signals, layouts,
+    # channel policies, RMS methods, hop sizes, thresholds and numbers of jobs, with small blocks so that signals
+    # span several of them.
+    from slicer2 import Slicer
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for case in range(cases):
+        kwargs = random_slicer_kwargs(rng)
+        channels = int(rng.choice([1, 2]))
+        channels_last = channels > 1 and rng.random() < 0.5
+        kwargs.update(
+            rms_method=RMS_METHODS[int(rng.integers(0, len(RMS_METHODS)))],
+            channel_policy=CHANNEL_POLICIES[int(rng.integers(0, len(CHANNEL_POLICIES)))] if channels > 1 else 'mean'
+        )
+        jobs = JOBS[int(rng.integers(0, len(JOBS)))]
+        waveform = random_waveform(rng, int(rng.integers(0, 50000)), channels)
+        if rng.random() < 0.5:
+            # Bring the loudest silences (3e-3) within rounding of the threshold, where the margin of the lower bound
+            # matters
+            waveform *= np.float32(10 ** (kwargs['threshold'] / 20) / 3e-3 * rng.uniform(0.999, 1.001))
+        if channels_last:
+            waveform = waveform.T
+        expected = Slicer(sr=1000, **kwargs).get_boundaries(waveform, channels_last=channels_last)
+        slicer = Slicer(sr=1000, search='coarse_to_fine', **kwargs)
+        rms_list = slicer.get_rms_sparse(
+            waveform, channels_last=channels_last, block_size=int(rng.choice([1000, 10000, 1 << 20])), jobs=jobs
+        )
+        num_samples = waveform.shape[0 if channels_last else -1]
+        if slicer.get_boundaries_from_rms(rms_list, num_samples) != expected \
+                or slicer.get_boundaries(waveform, channels_last=channels_last, jobs=jobs) != expected:
+            failures += 1
+            print(f'case {case}: {kwargs}, {channels} channels, jobs {jobs}: clips differ')
+    return failures
+
+
+def check_files(seed):
+    # Same on WAV files of synthetic speech, which the coarse to fine search reads memory-mapped.
+    import soundfile
+    from slicer2 import Slicer, _get_file_boundaries
+    failures = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for seconds, sr, channels, subtype in ((60, 16000, 1, 'PCM_16'), (120, 44100, 2, 'PCM_24'),
+                                               (60, 48000, 2, 'FLOAT')):
+            path = os.path.join(temp_dir, f'{seconds}_{sr}_{channels}.wav')
+            waveform = make_signal(seconds, sr, channels, seed=seed)
+            soundfile.write(path, waveform.T if channels > 1 else waveform, sr, subtype=subtype)
+            for policy in CHANNEL_POLICIES[:4 if channels > 1 else 1]:
+                for method in RMS_METHODS:
+                    for threshold in (-50., -40., -30.):
+                        kwargs = {'threshold': threshold, 'rms_method': method, 'channel_policy': policy}
+                        expected = _get_file_boundaries(path, Slicer(sr=sr, **kwargs), sr)
+                        for jobs in JOBS:
+                            slicer = Slicer(sr=sr, search='coarse_to_fine', **kwargs)
+                            if _get_file_boundaries(path, slicer, sr, jobs=jobs) != expected:
+                                failures += 1
+                                print(f'{path} ({subtype}), {kwargs}, jobs {jobs}: clips differ')
+    return failures
+
+
+def bench(seconds, sr):
+    # Time of the envelope and the state machine with each search on synthetic speech.
+    from slicer2 import SEARCHES, Slicer
+    waveform = make_signal(seconds, sr, 1)
+    for search in SEARCHES:
+        slicer = Slicer(sr=sr, search=search)
+        start = time.perf_counter()
+        slicer.get_boundaries(waveform)
+        print('%-14s %8ds  %8.4fs' % (search, seconds, time.perf_counter() - start))
+
+
+def main():
+    parser = ArgumentParser(description='Check that the coarse to fine search gives the same clips as the exhaustive '
+                                        'search on randomized signals and files, and time both')
+    parser.add_argument('--cases', type=int, default=500, help='Number of random signals and parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=600, help='Length of the synthetic audio that is timed')
+    args = parser.parse_args()
+    failures = check(args.cases, args.seed)
+    print(f'{args.cases} random cases: {failures} failed')
+    file_failures = check_files(args.seed)
+    print(f'WAV files: {file_failures} failed')
+    bench(args.seconds, 44100)
+    sys.exit(1 if failures or file_failures else 0)
+
+
+if __name__ == '__main__':
+    main()
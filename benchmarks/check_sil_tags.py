@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_slicers import make_signal
+from check_backends import random_envelope, random_slicer_kwargs
+
+
+def loop_sil_tags(slicer, rms_list):
+    # The per-frame loop of the original Slicer.slice(), kept as the reference of Slicer._get_sil_tags().
+    sil_tags = []
+    silence_start = None
+    clip_start = 0
+    for i, rms in enumerate(rms_list):
+        # Keep looping while frame is silent.
+        if rms < slicer.threshold:
+            # Record start of silent frames.
+            if silence_start is None:
+                silence_start = i
+            continue
+        # Keep looping while frame is not silent and silence start has not been recorded.
+        if silence_start is None:
+            continue
+        # Clear recorded silence start if interval is not enough or clip is too short
+        is_leading_silence = silence_start == 0 and i > slicer.max_sil_kept
+        need_slice_middle = i - silence_start >= slicer.min_interval and i - clip_start >= slicer.min_length
+        if not is_leading_silence and not need_slice_middle:
+            silence_start = None
+            continue
+        # Need slicing. Record the range of silent frames to be removed.
+        if i - silence_start <= slicer.max_sil_kept:
+            pos = rms_list[silence_start: i + 1].argmin() + silence_start
+            if silence_start == 0:
+                sil_tags.append((0, pos))
+            else:
+                sil_tags.append((pos, pos))
+            clip_start = pos
+        elif i - silence_start <= slicer.max_sil_kept * 2:
+            pos = rms_list[i - slicer.max_sil_kept: silence_start + slicer.max_sil_kept + 1].argmin()
+            pos += i - slicer.max_sil_kept
+            pos_l = rms_list[silence_start: silence_start + slicer.max_sil_kept + 1].argmin() + silence_start
+            pos_r = rms_list[i - slicer.max_sil_kept: i + 1].argmin() + i - slicer.max_sil_kept
+            if silence_start == 0:
+                sil_tags.append((0, pos_r))
+                clip_start = pos_r
+            else:
+                sil_tags.append((min(pos_l, pos), max(pos_r, pos)))
+                clip_start = max(pos_r, pos)
+        else:
+            pos_l = rms_list[silence_start: silence_start + slicer.max_sil_kept + 1].argmin() + silence_start
+            pos_r = rms_list[i - slicer.max_sil_kept: i + 1].argmin() + i - slicer.max_sil_kept
+            if silence_start == 0:
+                sil_tags.append((0, pos_r))
+            else:
+                sil_tags.append((pos_l, pos_r))
+            clip_start = pos_r
+        silence_start = None
+    # Deal with trailing silence.
+    total_frames = rms_list.shape[0]
+    if silence_start is not None and total_frames - silence_start >= slicer.min_interval:
+        silence_end = min(total_frames, silence_start + slicer.max_sil_kept)
+        pos = rms_list[silence_start: silence_end + 1].argmin() + silence_start
+        sil_tags.append((pos, total_frames + 1))
+    return sil_tags
+
+
+def check(cases, seed):
+    # Compares the silence tags of the vectorized state machine with those of the loop on random envelopes and
+    # random parameters, then on the envelopes of synthetic speech.
+    from slicer2 import Slicer, get_rms
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for case in range(cases):
+        kwargs = random_slicer_kwargs(rng)
+        slicer = Slicer(sr=1000, **kwargs)
+        rms_list = random_envelope(rng, int(rng.integers(1, 5000)), slicer.threshold)
+        expected = [(int(begin), int(end)) for begin, end in loop_sil_tags(slicer, rms_list)]
+        if [(int(begin), int(end)) for begin, end in slicer._get_sil_tags(rms_list)] != expected:
+            failures += 1
+            print(f'case {case}: {kwargs}, {rms_list.shape[0]} frames: tags differ')
+    for seconds, sr in ((60, 16000), (600, 44100)):
+        waveform = make_signal(seconds, sr, 1, seed=seed)
+        for threshold in (-50., -40., -30.):
+            slicer = Slicer(sr=sr, threshold=threshold)
+            rms_list = get_rms(waveform, frame_length=slicer.win_size, hop_length=slicer.hop_size).squeeze(0)
+            expected = [(int(begin), int(end)) for begin, end in loop_sil_tags(slicer, rms_list)]
+            if [(int(begin), int(end)) for begin, end in slicer._get_sil_tags(rms_list)] != expected:
+                failures += 1
+                print(f'{seconds}s at {sr} Hz, {threshold} dB: tags differ')
+    return failures
+
+
+def bench(seconds, sr):
+    # Time of the loop and of the vectorized state machine on the envelope of synthetic speech.
+    from slicer2 import Slicer, get_rms
+    waveform = make_signal(seconds, sr, 1)
+    slicer = Slicer(sr=sr)
+    rms_list = get_rms(waveform, frame_length=slicer.win_size, hop_length=slicer.hop_size).squeeze(0)
+    for name, get_sil_tags in (('loop', lambda: loop_sil_tags(slicer, rms_list)),
+                               ('numpy', lambda: slicer._get_sil_tags(rms_list))):
+        start = time.perf_counter()
+        get_sil_tags()
+        print('%-6s %8ds  state machine %8.4fs' % (name, seconds, time.perf_counter() - start))
+
+
+def main():
+    parser = ArgumentParser(description='Check that the vectorized silence detection gives the same silence tags as '
+                                        'the original per-frame loop on randomized signals, and time both')
+    parser.add_argument('--cases', type=int, default=1000, help='Number of random envelopes and parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=3600, help='Length of the synthetic audio that is timed')
+    args = parser.parse_args()
+    failures = check(args.cases, args.seed)
+    print(f'{args.cases} random cases: {failures} failed')
+    bench(args.seconds, 44100)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_slicers import make_signal
+from check_backends import random_slicer_kwargs
+
+
+def random_waveform(rng, num_samples, channels):
+    # Sound and near-silence alternating in runs of random lengths, starting with either, shaped (samples,) or
+    # (channels, samples).
+    waveform = np.empty((channels, num_samples), dtype=np.float32)
+    pos = 0
+    loud = rng.random() < 0.5
+    while pos < num_samples:
+        length = min(num_samples - pos, int(rng.choice([10, 100, 1000, 5000])) * int(rng.integers(1, 4)))
+        scale = rng.uniform(0.05, 0.5) if loud else rng.choice([1e-5, 1e-4, 3e-3])
+        waveform[:, pos: pos + length] = rng.standard_normal((channels, length), dtype=np.float32) * scale
+        pos += length
+        loud = not loud
+    return waveform[0] if channels == 1 else waveform
+
+
+def split_blocks(rng, waveform, channels_last, max_block):
+    # Consecutive blocks of random sizes, including empty ones.
+    num_samples = waveform.shape[0 if channels_last else -1]
+    blocks = []
+    pos = 0
+    while pos < num_samples:
+        size = int(rng.integers(0, max_block))
+        blocks.append(waveform[pos: pos + size] if channels_last else waveform[..., pos: pos + size])
+        pos += size
+    return blocks
+
+
+def stream(slicer, blocks, channels_last):
+    from slicer2 import StreamingSlicer
+    streaming = StreamingSlicer(slicer, channels_last=channels_last)
+    chunks = []
+    for block in blocks:
+        chunks += streaming.feed(block)
+    return chunks + streaming.flush()
+
+
+def same_clips(chunks, expected):
+    return len(chunks) == len(expected) and all(np.array_equal(a, b) for a, b in zip(chunks, expected))
+
+
+def check(cases, seed):
+    # Compares the clips of StreamingSlicer fed random-sized blocks with those of Slicer.slice() on random signals,
+    # layouts and parameters, then on synthetic speech.
+    from slicer2 import Slicer
+    rng = np.random.default_rng(seed)
+    failures = 0
+    for case in range(cases):
+        kwargs = random_slicer_kwargs(rng)
+        channels = int(rng.choice([1, 2]))
+        channels_last = channels > 1 and rng.random() < 0.5
+        kwargs.update(
+            rms_method=str(rng.choice(['strided', 'sliding'])),
+            channel_policy=['mean', 'max', 0, 1][int(rng.integers(0, 4))] if channels > 1 else 'mean'
+        )
+        slicer = Slicer(sr=1000, **kwargs)
+        waveform = random_waveform(rng, int(rng.integers(0, 50000)), channels)
+        if channels_last:
+            waveform = waveform.T
+        blocks = split_blocks(rng, waveform, channels_last, int(rng.choice([10, 500, 5000])))
+        if not same_clips(stream(slicer, blocks, channels_last), slicer.slice(waveform, channels_last=channels_last)):
+            failures += 1
+            print(f'case {case}: {kwargs}, {channels} channels: clips differ')
+    for seconds, sr in ((60, 16000), (600, 44100)):
+        waveform = make_signal(seconds, sr, 1, seed=seed)
+        slicer = Slicer(sr=sr)
+        if not same_clips(stream(slicer, split_blocks(rng, waveform, False, sr), False), slicer.slice(waveform)):
+            failures += 1
+            print(f'{seconds}s at {sr} Hz: clips differ')
+    return failures
+
+
+def check_leading_silence(seconds, seed):
+    # Feeds a long silence followed by a second of sound, and checks that the memory held while streaming stays
+    # far below the size of the silence, and that the clips are still those of slice().
+    from slicer2 import Slicer, StreamingSlicer
+    sr = 44100
+    slicer = Slicer(sr=sr)
+
+    def get_blocks():
+        rng = np.random.default_rng(seed)
+        for _ in range(int(seconds)):
+            yield rng.standard_normal(sr, dtype=np.float32) * 1e-4
+        yield rng.standard_normal(sr, dtype=np.float32) * 0.3
+
+    streaming = StreamingSlicer(slicer)
+    chunks = []
+    tracemalloc.start()
+    for block in get_blocks():
+        chunks += streaming.feed(block)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    chunks += streaming.flush()
+    # Whatever the length of the silence, a few seconds of audio are enough for max_sil_kept, min_interval and the
+    # blocks and temporaries in flight
+    limit = 20 * sr * 4
+    failures = 0
+    if peak > limit:
+        failures += 1
+        print(f'leading silence of {seconds}s: {peak} bytes held while streaming, more than {limit}')
+    if not same_clips(chunks, slicer.slice(np.concatenate(list(get_blocks())))):
+        failures += 1
+        print(f'leading silence of {seconds}s: clips differ')
+    print(f'leading silence of {seconds}s: peak of {peak / (1 << 20):.2f} MiB held while streaming')
+    return failures
+
+
+def main():
+    parser = ArgumentParser(description='Check that StreamingSlicer fed blocks of random sizes gives the same clips '
+                                        'as Slicer.slice(), and that its memory stays bounded over long silences')
+    parser.add_argument('--cases', type=int, default=500, help='Number of random signals and parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--seconds', type=float, default=600, help='Length of the leading silence')
+    args = parser.parse_args()
+    failures = check(args.cases, args.seed)
+    print(f'{args.cases} random cases: {failures} failed')
+    failures += check_leading_silence(args.seconds, args.seed)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
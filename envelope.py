@@ -0,0 +1,250 @@
+import os.path
+
+import numpy as np
+import soundfile
+
+from profiler import count, stage
+
+
+def _save_atomic(path, save, mode='wb'):
+    # Calls save() with a temporary file of the directory of path, unique to the caller, then moves it to path, so
+    # that readers never see a partial file and concurrent writers do not write to the same one.
+    import tempfile
+    fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with open(fd, mode, encoding=None if 'b' in mode else 'utf8') as f:
+            save(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class EnvelopeCache:
+    # On-disk cache of RMS envelopes, so that re-slicing the same audio with another threshold, min_length, etc.
+    # does not decode it again. Envelopes are keyed by the file (its path, size and mtime, or its content hash)
+    # and by everything the envelope depends on, saved as .npy files and memory-mapped on load. The least
+    # recently used envelopes are evicted once the cache is larger than max_bytes, down to evict_ratio * max_bytes
+    # so that the directory is only scanned once in a while. Between two scans, each process tracks the size of the
+    # cache from what it wrote itself. With max_bytes None, nothing is evicted.
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30, hash_content: bool = False,
+                 evict_ratio: float = 0.8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.evict_ratio = evict_ratio
+        self.total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, audio_path, slicer):
+        import hashlib
+        if self.hash_content:
+            digest = hashlib.sha1()
+            with open(audio_path, 'rb') as f:
+                for data in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(data)
+            source = digest.hexdigest()
+        else:
+            stat = os.stat(audio_path)
+            source = f'{os.path.realpath(audio_path)}|{stat.st_size}|{stat.st_mtime_ns}'
+        key = f'{source}|{slicer.hop_size}|{slicer.win_size}|{slicer.rms_method}|{slicer.channel_policy}'
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf8')).hexdigest())
+
+    def get(self, audio_path, slicer):
+        # The cached (rms_list, num_samples) of the file, or None.
+        key = self._key(audio_path, slicer)
+        try:
+            with open(key + '.txt', 'r', encoding='utf8') as f:
+                num_samples = int(f.read())
+            rms_list = np.load(key + '.npy', mmap_mode='r')
+            os.utime(key + '.npy')
+        except (OSError, ValueError):
+            count('cache_misses')
+            return None
+        count('cache_hits')
+        return rms_list, num_samples
+
+    def put(self, audio_path, slicer, rms_list, num_samples):
+        key = self._key(audio_path, slicer)
+        if self.total_bytes is None and self.max_bytes is not None:
+            self._evict()
+        _save_atomic(key + '.txt', lambda f: f.write(str(num_samples)), mode='w')
+        _save_atomic(key + '.npy', lambda f: np.save(f, rms_list))
+        if self.max_bytes is None:
+            return
+        self.total_bytes += os.path.getsize(key + '.npy')
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # Scans the cache and evicts the least recently used envelopes if it is larger than max_bytes.
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path[:-len('.npy')]))
+        self.total_bytes = sum(size for _, size, _ in entries)
+        if self.total_bytes <= self.max_bytes:
+            return
+        for _, size, key in sorted(entries):
+            if self.total_bytes <= self.max_bytes * self.evict_ratio:
+                break
+            for path in (key + '.npy', key + '.txt'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.total_bytes -= size
+
+
+class EnvelopePyramid:
+    # Multi-resolution energy of a waveform: the sums of squares of the samples in blocks of base_hop samples
+    # (level 0), and in blocks of 2, 4, 8, ... base hops (levels 1, 2, 3, ...), of each signal the channel policy
+    # takes from the audio. The envelope of any Slicer with the same channel policy, whose hop and window are
+    # multiples of base_hop, is then summed from the coarsest level that fits, without touching the audio. Sums are
+    # accumulated in float64, so the envelope is the one of rms_method='sliding' up to rounding.
+    def __init__(self, levels, base_hop, num_samples, sr, channel_policy='mean'):
+        self.levels = levels
+        self.base_hop = base_hop
+        self.num_samples = num_samples
+        self.sr = sr
+        self.channel_policy = channel_policy
+
+    @classmethod
+    def from_blocks(cls, blocks, sr, base_hop, channel_policy='mean', channels_last=False):
+        # Built in a single pass over consecutive blocks of the waveform, shaped as for Slicer.get_rms_stream().
+        from slicer2 import Slicer, _EnvelopeFramer
+        framer = _EnvelopeFramer(Slicer(sr=sr, hop_size=1, channel_policy=channel_policy), channels_last=channels_last)
+        parts = None
+        remainders = None
+        num_samples = 0
+        with stage('rms'):
+            for block in blocks:
+                num_samples += block.shape[0 if channels_last or len(block.shape) == 1 else -1]
+                signals = framer.get_signals(block)
+                if parts is None:
+                    parts = [[] for _ in signals]
+                    remainders = [signal[:0] for signal in signals]
+                for i, signal in enumerate(signals):
+                    if remainders[i].shape[0] > 0:
+                        signal = np.concatenate((remainders[i], signal))
+                    whole = signal.shape[0] // base_hop * base_hop
+                    hops = signal[:whole].reshape(-1, base_hop)
+                    parts[i].append(np.einsum('ij,ij->i', hops, hops, dtype=np.float64))
+                    remainders[i] = signal[whole:]
+            if num_samples == 0:
+                raise ValueError('Cannot build the envelope pyramid of empty audio')
+            for i, remainder in enumerate(remainders):
+                if remainder.shape[0] > 0:
+                    parts[i].append(np.array([np.dot(remainder, remainder.astype(np.float64))]))
+            levels = [np.stack([np.concatenate(part) for part in parts])]
+            while levels[-1].shape[1] > 1:
+                level = levels[-1]
+                if level.shape[1] % 2 == 1:
+                    level = np.pad(level, ((0, 0), (0, 1)))
+                levels.append(level[:, 0::2] + level[:, 1::2])
+        return cls(levels, base_hop, num_samples, sr, channel_policy=channel_policy)
+
+    def supports(self, slicer):
+        # Whether get_rms() can compute the envelope of the slicer.
+        return (
+            slicer.channel_policy == self.channel_policy and slicer.hop_size % self.base_hop == 0
+            and slicer.win_size % self.base_hop == 0 and slicer.win_size // 2 % self.base_hop == 0
+        )
+
+    def get_rms(self, slicer):
+        # Envelope of the slicer, like Slicer.get_rms_stream() of the waveform with rms_method='sliding'.
+        if not self.supports(slicer):
+            raise ValueError(
+                f'The envelope pyramid of base hop {self.base_hop} and channel policy {self.channel_policy} cannot give '
+                f'the envelope of hop {slicer.hop_size}, window {slicer.win_size} and policy {slicer.channel_policy}'
+            )
+        from slicer2 import _EnvelopeFramer
+        hop_size, win_size = slicer.hop_size, slicer.win_size
+        pad = win_size // 2
+        # The coarsest level whose blocks all frames start and end at
+        level = 0
+        while (
+                level + 1 < len(self.levels)
+                and hop_size % (self.base_hop << level + 1) == 0 and pad % (self.base_hop << level + 1) == 0
+                and win_size % (self.base_hop << level + 1) == 0
+        ):
+            level += 1
+        block_size = self.base_hop << level
+        sums = self.levels[level]
+        num_frames = max(0, 1 + (self.num_samples + 2 * pad - win_size) // hop_size)
+        stride, width = hop_size // block_size, win_size // block_size
+        with stage('rms'):
+            # Blocks of the zero-padded waveform that the frames cover
+            padded = np.zeros((sums.shape[0], max(0, num_frames - 1) * stride + width), dtype=np.float64)
+            length = min(sums.shape[1], padded.shape[1] - pad // block_size)
+            padded[:, pad // block_size: pad // block_size + length] = sums[:, :length]
+            window_sums = np.zeros((sums.shape[0], num_frames), dtype=np.float64)
+            for i in range(width):
+                window_sums += padded[:, i: i + (num_frames - 1) * stride + 1: stride]
+            rms_lists = np.sqrt((window_sums / win_size).astype(np.float32))
+        return _EnvelopeFramer.reduce(list(rms_lists))
+
+    def save(self, path, source=None):
+        # source is an optional dict of integers describing where the pyramid comes from, returned by load().
+        metadata = {
+            'base_hop': self.base_hop, 'num_samples': self.num_samples, 'sr': self.sr,
+            'channel_policy': str(self.channel_policy)
+        }
+        for key, value in (source or {}).items():
+            metadata['source_' + key] = value
+        levels = {f'level_{i}': level for i, level in enumerate(self.levels)}
+        _save_atomic(path, lambda f: np.savez(f, **metadata, **levels))
+
+    @classmethod
+    def load(cls, path):
+        # (pyramid, source) saved by save().
+        with np.load(path) as data:
+            channel_policy = str(data['channel_policy'])
+            levels = []
+            while f'level_{len(levels)}' in data:
+                levels.append(data[f'level_{len(levels)}'])
+            source = {key[len('source_'):]: int(data[key]) for key in data.files if key.startswith('source_')}
+            pyramid = cls(
+                levels, int(data['base_hop']), int(data['num_samples']), int(data['sr']),
+                channel_policy=int(channel_policy) if channel_policy.isdigit() else channel_policy
+            )
+        return pyramid, source
+
+
+def get_file_pyramid(audio_path, hop_size=10, channel_policy='mean', path=None):
+    # EnvelopePyramid of the file at its own sample rate, with a base hop of hop_size milliseconds (rounded like
+    # Slicer.hop_size). It is saved to path, <audio_path>.pyramid.npz by default, and loaded from there as long as the
+    # file and the parameters are the same. Its directory is created if needed; if path still cannot be written, the
+    # pyramid is only returned, with a warning.
+    from slicer2 import _read_blocks
+    if path is None:
+        path = audio_path + '.pyramid.npz'
+    stat = os.stat(audio_path)
+    source = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    sr = soundfile.info(audio_path).samplerate
+    base_hop = round(sr * hop_size / 1000)
+    try:
+        pyramid, saved = EnvelopePyramid.load(path)
+        if saved == source and pyramid.base_hop == base_hop and pyramid.channel_policy == channel_policy:
+            count('cache_hits')
+            return pyramid
+    except (OSError, ValueError, KeyError):
+        pass
+    count('cache_misses')
+    pyramid = EnvelopePyramid.from_blocks(
+        _read_blocks(audio_path, sr), sr, base_hop, channel_policy=channel_policy, channels_last=True
+    )
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        pyramid.save(path, source=source)
+    except OSError as e:
+        import warnings
+        warnings.warn(f'Cannot save the envelope pyramid of {audio_path} to {path} ({e})')
+    return pyramid
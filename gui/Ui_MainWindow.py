@@ -18,7 +18,8 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
 from PySide6.QtWidgets import (QApplication, QFormLayout, QFrame, QGroupBox,
     QHBoxLayout, QLabel, QLineEdit, QListWidget,
     QListWidgetItem, QMainWindow, QProgressBar, QPushButton,
-    QSizePolicy, QSpacerItem, QVBoxLayout, QWidget)
+    QSizePolicy, QSpacerItem, QSpinBox, QVBoxLayout,
+    QWidget)
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -140,6 +141,18 @@ class Ui_MainWindow(object):
 
         self.formLayout.setWidget(4, QFormLayout.FieldRole, self.lineEditMaxSilence)
 
+        self.label_8 = QLabel(self.groupBox_2)
+        self.label_8.setObjectName(u"label_8")
+
+        self.formLayout.setWidget(5, QFormLayout.LabelRole, self.label_8)
+
+        self.spinBoxJobs = QSpinBox(self.groupBox_2)
+        self.spinBoxJobs.setObjectName(u"spinBoxJobs")
+        self.spinBoxJobs.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+        self.spinBoxJobs.setMinimum(1)
+
+        self.formLayout.setWidget(5, QFormLayout.FieldRole, self.spinBoxJobs)
+
 
         self.verticalLayout_3.addLayout(self.formLayout)
 
@@ -218,6 +231,7 @@ class Ui_MainWindow(object):
         self.lineEditHopSize.setText(QCoreApplication.translate("MainWindow", u"10", None))
         self.label_6.setText(QCoreApplication.translate("MainWindow", u"Maximum Silence Length (ms)", None))
         self.lineEditMaxSilence.setText(QCoreApplication.translate("MainWindow", u"1000", None))
+        self.label_8.setText(QCoreApplication.translate("MainWindow", u"Parallel Jobs", None))
         self.label_7.setText(QCoreApplication.translate("MainWindow", u"Output Directory (default to the same as the audio)", None))
         self.lineEditOutputDir.setText("")
         self.pushButtonBrowse.setText(QCoreApplication.translate("MainWindow", u"Browse...", None))
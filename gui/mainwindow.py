@@ -1,16 +1,15 @@
 import os
+import multiprocessing
 
-import soundfile
-import numpy as np
 import urllib
 
 from typing import List
 from PySide6.QtCore import *
 from PySide6.QtWidgets import *
 from PySide6.QtGui import *
-from slicer2 import Slicer
 
 from gui.Ui_MainWindow import Ui_MainWindow
+from pipeline import CANCELLED
 
 
 class MainWindow(QMainWindow):
@@ -37,12 +36,20 @@ class MainWindow(QMainWindow):
         self.ui.lineEditHopSize.setValidator(validator)
         self.ui.lineEditMaxSilence.setValidator(validator)
 
+        self.ui.spinBoxJobs.setMaximum(os.cpu_count() or 1)
+        self.ui.spinBoxJobs.setValue(os.cpu_count() or 1)
+
         # State variables
         self.workers: list[QThread] = []
         self.workCount = 0
         self.workFinished = 0
+        self.workFailed = 0
         self.processing = False
 
+        # Envelopes of sliced files, so that slicing them again with other parameters is fast
+        self.envelopeCacheDir = os.path.join(QStandardPaths.writableLocation(
+            QStandardPaths.StandardLocation.CacheLocation), 'envelopes')
+
         self.setWindowTitle(QApplication.applicationName())
 
         # Must set to accept drag and drop events
@@ -81,56 +88,83 @@ class MainWindow(QMainWindow):
 
     def _q_start(self):
         if self.processing:
-            self.warningProcessNotFinished()
+            self._q_cancel()
             return
 
         item_count = self.ui.listWidgetTaskList.count()
         if item_count == 0:
             return
 
+        try:
+            slicer_kwargs = {
+                'threshold': float(self.ui.lineEditThreshold.text()),
+                'min_length': int(self.ui.lineEditMinLen.text()),
+                'min_interval': int(self.ui.lineEditMinInterval.text()),
+                'hop_size': int(self.ui.lineEditHopSize.text()),
+                'max_sil_kept': int(self.ui.lineEditMaxSilence.text())
+            }
+        except ValueError:
+            QMessageBox.warning(self, QApplication.applicationName(),
+                                "Please fill in all the settings!")
+            return
+
         class WorkThread(QThread):
-            oneFinished = Signal()
+            oneFinished = Signal(int, int, str)
 
-            def __init__(self, filenames: List[str], window: MainWindow):
+            def __init__(self, filenames: List[str], out_dir: str, slicer_kwargs: dict, cache_dir: str, jobs: int):
                 super().__init__()
 
                 self.filenames = filenames
-                self.win = window
+                self.out_dir = out_dir
+                self.slicer_kwargs = slicer_kwargs
+                self.cache_dir = cache_dir
+                self.jobs = jobs
+                self.executor = None
+                self.cancelled = False
 
             def run(self):
-                for filename in self.filenames:
-                    audio, sr = soundfile.read(filename, dtype=np.float32)
-                    is_mono = True
-                    if len(audio.shape) > 1:
-                        is_mono = False
-                        audio = audio.T
-                    slicer = Slicer(
-                        sr=sr,
-                        threshold=float(self.win.ui.lineEditThreshold.text()),
-                        min_length=int(self.win.ui.lineEditMinLen.text()),
-                        min_interval=int(
-                            self.win.ui.lineEditMinInterval.text()),
-                        hop_size=int(self.win.ui.lineEditHopSize.text()),
-                        max_sil_kept=int(self.win.ui.lineEditMaxSilence.text())
-                    )
-                    chunks = slicer.slice(audio)
-                    out_dir = self.win.ui.lineEditOutputDir.text()
-                    if out_dir == '':
-                        out_dir = os.path.dirname(os.path.abspath(filename))
+                # Imported here so that numpy and soundfile do not delay showing the window
+                from gui.worker import STAGES
+                from ledger import Ledger
+                from pipeline import PipelineExecutor
+                from slicer2 import get_clip_stems
+
+                # Files already sliced into their output directory with the same settings are skipped
+                out_dirs = [
+                    self.out_dir if self.out_dir != '' else os.path.dirname(os.path.abspath(filename))
+                    for filename in self.filenames
+                ]
+                ledgers = {out_dir: Ledger(out_dir) for out_dir in out_dirs}
+                keys = [os.path.abspath(filename) for filename in self.filenames]
+                # Files of the same name going to the same directory get distinct clip names
+                stems = get_clip_stems(self.filenames, out_dirs)
+                shared = {out_dir: ledger.get_shared_clips() for out_dir, ledger in ledgers.items()}
+
+                # Use processes to slice several files at once, spawned to avoid forking the Qt application.
+                # Each of them decodes the next file while slicing and writing the current one.
+                self.executor = PipelineExecutor(STAGES, jobs=self.jobs,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                if self.cancelled:
+                    self.executor.cancel()
+                tasks = [
+                    (filename, out_dir, self.slicer_kwargs, self.cache_dir, ledgers[out_dir].get(key),
+                     shared[out_dir], stem)
+                    for filename, out_dir, key, stem in zip(self.filenames, out_dirs, keys, stems)
+                ]
+                for index, result, error in self.executor.map_unordered(tasks):
+                    if error is None:
+                        clips, entry = result
+                        if entry is not None:
+                            ledgers[out_dirs[index]].record(keys[index], entry, entry.pop('clips'))
+                        self.oneFinished.emit(index, clips, '')
                     else:
-                        # Make dir if not exists
-                        info = QDir(out_dir)
-                        if not info.exists():
-                            info.mkpath(out_dir)
-
-                    for i, chunk in enumerate(chunks):
-                        path = os.path.join(out_dir, f'%s_%d.wav' % (os.path.basename(filename)
-                                                                     .rsplit('.', maxsplit=1)[0], i))
-                        if not is_mono:
-                            chunk = chunk.T
-                        soundfile.write(path, chunk, sr)
+                        self.oneFinished.emit(index, -1, error)
 
-                    self.oneFinished.emit()
+            def cancel(self):
+                # Files being sliced are finished, the rest are skipped
+                self.cancelled = True
+                if self.executor is not None:
+                    self.executor.cancel()
 
         # Collect paths
         paths: list[str] = []
@@ -138,26 +172,46 @@ class MainWindow(QMainWindow):
             item = self.ui.listWidgetTaskList.item(i)
             path = item.data(Qt.ItemDataRole.UserRole + 1)  # Get full path
             paths.append(path)
+            item.setText(QFileInfo(path).fileName())
+            item.setToolTip(path)
 
         self.ui.progressBar.setMaximum(item_count)
         self.ui.progressBar.setValue(0)
 
         self.workCount = item_count
         self.workFinished = 0
+        self.workFailed = 0
         self.setProcessing(True)
 
         # Start work thread
-        worker = WorkThread(paths, self)
+        worker = WorkThread(paths, self.ui.lineEditOutputDir.text(), slicer_kwargs, self.envelopeCacheDir,
+                            self.ui.spinBoxJobs.value())
         worker.oneFinished.connect(self._q_oneFinished)
         worker.finished.connect(self._q_threadFinished)
         worker.start()
 
         self.workers.append(worker)  # Collect in case of auto deletion
 
-    def _q_oneFinished(self):
+    def _q_cancel(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.ui.pushButtonStart.setText("Cancelling...")
+        self.ui.pushButtonStart.setEnabled(False)
+
+    def _q_oneFinished(self, index: int, clips: int, error: str):
         self.workFinished += 1
         self.ui.progressBar.setValue(self.workFinished)
 
+        # Show the result of the file in the task list
+        item = self.ui.listWidgetTaskList.item(index)
+        name = QFileInfo(item.data(Qt.ItemDataRole.UserRole + 1)).fileName()
+        if error == '':
+            item.setText(f"{name} ({clips} clips)")
+        else:
+            self.workFailed += 1
+            item.setText(f"{name} (failed)" if error != CANCELLED else f"{name} (cancelled)")
+            item.setToolTip(error)
+
     def _q_threadFinished(self):
         # Join all workers
         for worker in self.workers:
@@ -165,8 +219,14 @@ class MainWindow(QMainWindow):
         self.workers.clear()
         self.setProcessing(False)
 
-        QMessageBox.information(
-            self, QApplication.applicationName(), "Slicing complete!")
+        if self.workFailed == 0:
+            QMessageBox.information(
+                self, QApplication.applicationName(), "Slicing complete!")
+        else:
+            QMessageBox.warning(
+                self, QApplication.applicationName(),
+                f"Slicing complete, {self.workFailed} of {self.workCount} files were not sliced.\n"
+                "Hover over them in the task list for details.")
 
     def warningProcessNotFinished(self):
         QMessageBox.warning(self, QApplication.applicationName(),
@@ -175,8 +235,8 @@ class MainWindow(QMainWindow):
     def setProcessing(self, processing: bool):
         enabled = not processing
         self.ui.pushButtonStart.setText(
-            "Slicing..." if processing else "Start")
-        self.ui.pushButtonStart.setEnabled(enabled)
+            "Cancel" if processing else "Start")
+        self.ui.pushButtonStart.setEnabled(True)
         self.ui.pushButtonAddFiles.setEnabled(enabled)
         self.ui.listWidgetTaskList.setEnabled(enabled)
         self.ui.pushButtonClearList.setEnabled(enabled)
@@ -185,6 +245,7 @@ class MainWindow(QMainWindow):
         self.ui.lineEditMinInterval.setEnabled(enabled)
         self.ui.lineEditHopSize.setEnabled(enabled)
         self.ui.lineEditMaxSilence.setEnabled(enabled)
+        self.ui.spinBoxJobs.setEnabled(enabled)
         self.ui.lineEditOutputDir.setEnabled(enabled)
         self.ui.pushButtonBrowse.setEnabled(enabled)
         self.processing = processing
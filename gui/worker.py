@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import soundfile
+
+from envelope import EnvelopeCache
+from ledger import get_entry, is_done, remove_clips
+from slicer2 import Slicer, can_copy_slices, copy_slices, get_clip_names
+
+_SKIPPED = 'skipped'
+
+
+# This module is imported by the worker processes of the GUI, so it must not import Qt.
+# Each file goes through STAGES, which the workers overlap between consecutive files: read_file() decodes it,
+# slice_audio() slices it and write_clips() encodes the clips. Files whose clips can be copied from the source are
+# handled as a whole by slice_audio(). previous is the ledger entry of the file in out_dir, if any: files sliced the
+# same way before are skipped (shared are the clips that ledger entries of other files list too, which are not
+# removed), and write_clips() returns (number of clips, new ledger entry or None if skipped).
+# Clips are named after stem, see slicer2.get_clip_stems().
+def read_file(task):
+    filename, out_dir, slicer_kwargs, cache_dir, previous, shared, stem = task
+    if out_dir == '':
+        out_dir = os.path.dirname(os.path.abspath(filename))
+    copy = can_copy_slices(filename)
+    entry = get_entry(filename, dict(slicer_kwargs, copy=copy, sr=None), previous)
+    if is_done(entry, previous, out_dir):
+        return filename, out_dir, stem, slicer_kwargs, cache_dir, entry, _SKIPPED, len(previous['clips'])
+    remove_clips(previous, out_dir, shared)
+    if copy:
+        return filename, out_dir, stem, slicer_kwargs, cache_dir, entry, None, None
+    # Slice the (samples, channels) audio read by soundfile as is; clips are views written without transposing
+    audio, sr = soundfile.read(filename, dtype=np.float32)
+    return filename, out_dir, stem, slicer_kwargs, cache_dir, entry, audio, sr
+
+
+def slice_audio(task):
+    filename, out_dir, stem, slicer_kwargs, cache_dir, entry, audio, sr = task
+    if audio is _SKIPPED:
+        return filename, out_dir, stem, entry, audio, sr
+    os.makedirs(out_dir, exist_ok=True)
+    if audio is None:
+        # Copy the frames of each clip straight from the source file
+        slicer = Slicer(sr=soundfile.info(filename).samplerate, **slicer_kwargs)
+        cache = EnvelopeCache(cache_dir) if cache_dir is not None else None
+        return filename, out_dir, stem, entry, copy_slices(filename, slicer, out_dir, cache=cache, stem=stem), None
+    slicer = Slicer(sr=sr, **slicer_kwargs)
+    return filename, out_dir, stem, entry, slicer.slice(audio, channels_last=True), sr
+
+
+def write_clips(task):
+    filename, out_dir, stem, entry, chunks, sr = task
+    if chunks is _SKIPPED:
+        return sr, None
+    if sr is None:
+        # Already copied, chunks is the number of clips
+        return chunks, dict(entry, clips=get_clip_names(filename, chunks, copy=True, stem=stem))
+    for i, chunk in enumerate(chunks):
+        soundfile.write(os.path.join(out_dir, f'%s_%d.wav' % (stem, i)), chunk, sr)
+    return len(chunks), dict(entry, clips=get_clip_names(filename, len(chunks), stem=stem))
+
+
+STAGES = [read_file, slice_audio, write_clips]
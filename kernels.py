@@ -0,0 +1,76 @@
+import numba
+import numpy as np
+
+
+# Compiled state machine of slicer2.Slicer, used with backend='numba'. This module is only imported by the slicers
+# that use it, as importing numba takes a while. Compiled code is cached on disk (in __pycache__, or in a user-wide
+# cache directory if that is not writable), so that the JIT cost is only paid once per machine.
+@numba.njit(cache=True, nogil=True)
+def get_sil_tags(rms_list, threshold, min_interval, min_length, max_sil_kept):
+    # The frame loop of the original Slicer.slice(): returns the (begin, end) frame ranges of silence to be removed
+    # as an (n, 2) array, and the number of silent runs. threshold must have the dtype of rms_list, so that frames
+    # are compared to it as in NumPy.
+    total_frames = rms_list.shape[0]
+    # At most one tag per silent run, plus the trailing one
+    max_tags = 1
+    previous = False
+    for i in range(total_frames):
+        silent = rms_list[i] < threshold
+        if silent and not previous:
+            max_tags += 1
+        previous = silent
+    sil_tags = np.empty((max_tags, 2), dtype=np.int64)
+    num_tags = 0
+    num_runs = 0
+    silence_start = -1
+    clip_start = 0
+    for i in range(total_frames):
+        # Keep looping while frame is silent.
+        if rms_list[i] < threshold:
+            # Record start of silent frames.
+            if silence_start < 0:
+                silence_start = i
+                num_runs += 1
+            continue
+        # Keep looping while frame is not silent and silence start has not been recorded.
+        if silence_start < 0:
+            continue
+        # Clear recorded silence start if interval is not enough or clip is too short
+        is_leading_silence = silence_start == 0 and i > max_sil_kept
+        need_slice_middle = i - silence_start >= min_interval and i - clip_start >= min_length
+        if not is_leading_silence and not need_slice_middle:
+            silence_start = -1
+            continue
+        # Need slicing. Record the range of silent frames to be removed.
+        if i - silence_start <= max_sil_kept:
+            pos = rms_list[silence_start: i + 1].argmin() + silence_start
+            sil_tags[num_tags, 0] = 0 if silence_start == 0 else pos
+            sil_tags[num_tags, 1] = pos
+            clip_start = pos
+        elif i - silence_start <= max_sil_kept * 2:
+            pos = rms_list[i - max_sil_kept: silence_start + max_sil_kept + 1].argmin() + i - max_sil_kept
+            pos_l = rms_list[silence_start: silence_start + max_sil_kept + 1].argmin() + silence_start
+            pos_r = rms_list[i - max_sil_kept: i + 1].argmin() + i - max_sil_kept
+            if silence_start == 0:
+                sil_tags[num_tags, 0] = 0
+                sil_tags[num_tags, 1] = pos_r
+                clip_start = pos_r
+            else:
+                sil_tags[num_tags, 0] = min(pos_l, pos)
+                sil_tags[num_tags, 1] = max(pos_r, pos)
+                clip_start = max(pos_r, pos)
+        else:
+            pos_l = rms_list[silence_start: silence_start + max_sil_kept + 1].argmin() + silence_start
+            pos_r = rms_list[i - max_sil_kept: i + 1].argmin() + i - max_sil_kept
+            sil_tags[num_tags, 0] = 0 if silence_start == 0 else pos_l
+            sil_tags[num_tags, 1] = pos_r
+            clip_start = pos_r
+        num_tags += 1
+        silence_start = -1
+    # Deal with trailing silence.
+    if silence_start >= 0 and total_frames - silence_start >= min_interval:
+        silence_end = min(total_frames, silence_start + max_sil_kept)
+        sil_tags[num_tags, 0] = rms_list[silence_start: silence_end + 1].argmin() + silence_start
+        sil_tags[num_tags, 1] = total_frames + 1
+        num_tags += 1
+    return sil_tags[:num_tags], num_runs
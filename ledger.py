@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+
+# File name of the ledger in the output directory.
+LEDGER_NAME = '.slicer_ledger.jsonl'
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(block_size), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def get_entry(audio_path, params, previous=None):
+    # Ledger entry of the file about to be sliced with params: its size, mtime and content hash. The hash of the
+    # previous entry is reused if the size and mtime of the file did not change, so unchanged files are not read.
+    stat = os.stat(audio_path)
+    if previous is not None and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+        digest = previous['hash']
+    else:
+        digest = hash_file(audio_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest, 'params': params}
+
+
+def is_done(entry, previous, ledger_dir):
+    # Whether the file of entry was already sliced with the same content and parameters, and its clips still exist.
+    return (
+        previous is not None and previous['hash'] == entry['hash'] and previous['params'] == entry['params']
+        and all(os.path.isfile(os.path.join(ledger_dir, clip)) for clip in previous['clips'])
+    )
+
+
+def remove_clips(previous, ledger_dir, shared=()):
+    # Removes the clips of the previous slicing of a file, some of which may not be written again. Clips in shared
+    # (see Ledger.get_shared_clips()) are also listed by other files and are left alone.
+    if previous is None:
+        return
+    for clip in previous['clips']:
+        if clip in shared:
+            continue
+        try:
+            os.remove(os.path.join(ledger_dir, clip))
+        except OSError:
+            pass
+
+
+class Ledger:
+    # Completion index of an output directory, kept in <ledger_dir>/.slicer_ledger.jsonl: one JSON line per sliced
+    # file, with its content hash, the slicing parameters and its clips (relative to ledger_dir). Lines are appended
+    # as soon as each file is done, so an interrupted run only loses the files in progress. The last line of a file
+    # wins; a line cut short by a crash is ignored.
+    def __init__(self, ledger_dir):
+        self.ledger_dir = ledger_dir
+        self.path = os.path.join(ledger_dir, LEDGER_NAME)
+        self.entries = {}
+        self.complete = True
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                for line in f:
+                    self.complete = line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['audio']] = entry
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def get_shared_clips(self):
+        # Clips listed by more than one entry, e.g. by files of the same stem sliced before their clips were kept
+        # apart. Removing the previous clips of one of them must not remove those of the others.
+        seen = set()
+        shared = set()
+        for entry in self.entries.values():
+            for clip in entry['clips']:
+                if clip in seen:
+                    shared.add(clip)
+                seen.add(clip)
+        return shared
+
+    def record(self, key, entry, clips):
+        entry = dict(entry, audio=key, clips=clips)
+        self.entries[key] = entry
+        os.makedirs(self.ledger_dir, exist_ok=True)
+        with open(self.path, 'a', encoding='utf8') as f:
+            if not self.complete:
+                f.write('\n')
+                self.complete = True
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
@@ -0,0 +1,173 @@
+import multiprocessing
+import queue
+import threading
+from contextlib import nullcontext
+
+from profiler import profile
+
+# Error of the items skipped by PipelineExecutor.cancel()
+CANCELLED = 'Cancelled'
+
+
+def prefetch(iterable, size=2):
+    # Iterates over iterable in a background thread, at most size items ahead of the consumer. Exceptions are
+    # raised to the consumer; if the consumer stops early, the background thread stops after its current item.
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                items.put((item, None))
+                if stopped.is_set():
+                    return
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        # Unblock the producer if it is waiting for room in the queue.
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def _apply(stage, task):
+    index, value, error = task
+    if error is not None:
+        return task
+    try:
+        return index, stage(value), None
+    except Exception as e:
+        return index, None, f'{type(e).__name__}: {e}'
+
+
+def run_pipeline(tasks, stages, size=2):
+    # Runs the stages over (index, value) tasks in this process, each stage but the last one in its own thread, so
+    # that decoding, slicing and encoding of consecutive items overlap. Stages are connected by queues of at most
+    # size items, so a slow stage holds the others back instead of piling up decoded audio. Yields
+    # (index, value, error) in order, where error is the message of the exception raised by a stage, or None.
+    results = ((index, value, None) for index, value in tasks)
+    for stage in stages[:-1]:
+        results = prefetch(map(lambda task, stage=stage: _apply(stage, task), results), size)
+    for task in results:
+        yield _apply(stages[-1], task)
+
+
+# Queues of the worker processes of PipelineExecutor
+_tasks = None
+_results = None
+
+
+def _init_worker(tasks, results):
+    global _tasks, _results
+    _tasks = tasks
+    _results = results
+
+
+def _run_worker(stages, size, profiled):
+    def tasks():
+        while True:
+            task = _tasks.get()
+            if task is None:
+                return
+            yield task
+
+    with profile() if profiled else nullcontext() as profiler:
+        for result in run_pipeline(tasks(), stages, size=size):
+            _results.put(result)
+    return profiler.summary() if profiled else None
+
+
+class PipelineExecutor:
+    # Runs the stages over many items in a pool of worker processes. Each worker runs them as a pipeline and takes
+    # the next item from a shared queue, so that workers are balanced whatever the size of the items. Stages must be
+    # picklable (i.e. module level) functions; an optional Profiler receives the profiles of all workers.
+    def __init__(self, stages, jobs=None, size=2, mp_context=None, profiler=None):
+        self.stages = stages
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.size = size
+        self.mp_context = mp_context or multiprocessing.get_context()
+        self.profiler = profiler
+        self.tasks = None
+        self.results = None
+        self.cancelled = False
+
+    def map_unordered(self, items):
+        # Yields (index, value, error) of the items as they are finished.
+        from concurrent.futures import ProcessPoolExecutor
+        items = list(items)
+        if len(items) == 0:
+            return
+        jobs = min(self.jobs, len(items))
+        self.tasks = self.mp_context.Queue()
+        self.results = self.mp_context.Queue()
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=self.mp_context, initializer=_init_worker,
+                                 initargs=(self.tasks, self.results)) as executor:
+            futures = [executor.submit(_run_worker, self.stages, self.size, self.profiler is not None)
+                       for _ in range(jobs)]
+            # Filled only once the workers are started, as the queue starts a feeder thread that must not be forked.
+            for task in enumerate(items):
+                self.tasks.put(task)
+            for _ in range(jobs):
+                self.tasks.put(None)
+            if self.cancelled:
+                self.cancel()
+            remaining = len(items)
+            while remaining > 0:
+                try:
+                    result = self.results.get(timeout=0.5)
+                except queue.Empty:
+                    # A worker that died cannot finish its items
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    continue
+                remaining -= 1
+                yield result
+            for future in futures:
+                summary = future.result()
+                if self.profiler is not None:
+                    self.profiler.merge(summary)
+
+    def map(self, items):
+        # Same as map_unordered(), in the order of the items.
+        finished = {}
+        next_index = 0
+        for index, value, error in self.map_unordered(items):
+            finished[index] = (index, value, error)
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+    def cancel(self):
+        # Items not taken by any worker yet are finished with the CANCELLED error; the others are completed.
+        self.cancelled = True
+        if self.tasks is None:
+            return
+        workers = 0
+        while True:
+            try:
+                task = self.tasks.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if task is None:
+                workers += 1
+            else:
+                self.results.put((task[0], None, CANCELLED))
+        for _ in range(workers):
+            self.tasks.put(None)
@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    # Accumulates the time spent in each stage of slicing (decode, downmix, rms, state_machine, slice, encode, ...)
+    # and per-call counters (frames, silence_runs, clips, ...). An optional callback receives (stage, seconds) as
+    # soon as each stage finishes. Stages running in several threads at once are all accounted for, so the times
+    # may add up to more than the wall time.
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add_time(self, name, seconds, calls=1):
+        with self.lock:
+            stage = self.stages.setdefault(name, {'seconds': 0., 'calls': 0})
+            stage['seconds'] += seconds
+            stage['calls'] += calls
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, summary):
+        for name, stage in summary['stages'].items():
+            self.add_time(name, stage['seconds'], stage['calls'])
+        for name, value in summary['counters'].items():
+            self.count(name, value)
+
+    def summary(self):
+        with self.lock:
+            return {
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'counters': dict(self.counters)
+            }
+
+
+# Profilers being recorded to, innermost last. Stages and counters cost a single check while this is empty.
+_profilers = []
+
+
+@contextmanager
+def profile(callback=None):
+    profiler = Profiler(callback=callback)
+    _profilers.append(profiler)
+    try:
+        yield profiler
+    finally:
+        _profilers.remove(profiler)
+
+
+@contextmanager
+def stage(name):
+    if not _profilers:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        for profiler in _profilers:
+            profiler.add_time(name, seconds)
+            if profiler.callback is not None:
+                profiler.callback(name, seconds)
+
+
+def count(name, value=1):
+    for profiler in _profilers:
+        profiler.count(name, value)
+
+
+def write_summary(path, profiler: Profiler):
+    import json
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump(profiler.summary(), f, indent=2)
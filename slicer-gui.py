@@ -1,6 +1,7 @@
 import os
 import sys
 import datetime
+import multiprocessing
 
 from PySide6 import QtCore
 from PySide6.QtWidgets import QApplication
@@ -9,6 +10,9 @@ from PySide6.QtGui import QFont
 import gui.mainwindow
 
 if __name__ == '__main__':
+    # Required by the worker processes of frozen (PyInstaller) builds.
+    multiprocessing.freeze_support()
+
     # Write console outputs to log file.
     __stderr__ = sys.stderr
     date_time = datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
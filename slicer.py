@@ -1,33 +1,57 @@
 import os.path
 from argparse import ArgumentParser
-import time
 
-import librosa
 import numpy as np
 import soundfile
-from scipy.ndimage import maximum_filter1d, uniform_filter1d
 
+from profiler import count, profile, stage, write_summary
+from slicer2 import load_audio
 
-def timeit(func):
-    def run(*args, **kwargs):
-        t = time.time()
-        res = func(*args, **kwargs)
-        print('executing \'%s\' cost %.3fs' % (func.__name__, time.time() - t))
-        return res
-    return run
 
-
-# @timeit
+# scipy is imported by the functions that use it, so that importing this module stays fast.
 def _window_maximum(arr, win_sz):
+    from scipy.ndimage import maximum_filter1d
     return maximum_filter1d(arr, size=win_sz)[win_sz // 2: win_sz // 2 + arr.shape[0] - win_sz + 1]
 
 
-# @timeit
 def _window_rms(arr, win_sz):
+    from scipy.ndimage import uniform_filter1d
     filtered = np.sqrt(uniform_filter1d(np.power(arr, 2), win_sz) - np.power(uniform_filter1d(arr, win_sz), 2))
     return filtered[win_sz // 2: win_sz // 2 + arr.shape[0] - win_sz + 1]
 
 
+def _window_rms_argmin(arr, begins, lengths, win_sz, max_elements=1 << 20):
+    # Same as np.argmin(level2db(_window_rms(arr[begin: begin + length], win_sz))) for each region, where every
+    # length >= win_sz, computed for all regions at once. uniform_filter1d() keeps a running sum from the start of
+    # its (reflect-padded) input, so each region is filtered on its own here as well, to reproduce it bit for bit.
+    positions = np.empty(begins.shape[0], dtype=np.int64)
+    if begins.shape[0] == 0:
+        return positions
+    width = int(lengths.max()) + win_sz - 1
+    columns = np.arange(width)
+    offsets = np.arange(int(lengths.max()) - win_sz + 1)
+    batch = max(1, max_elements // width)
+    for i in range(0, begins.shape[0], batch):
+        begin = begins[i: i + batch, None]
+        length = lengths[i: i + batch, None]
+        # Indices of the padded lines, mirrored at both ends of each region
+        index = columns - win_sz // 2
+        index = np.where(index < 0, -index - 1, index)
+        index = np.maximum(np.where(index >= length, 2 * length - index - 1, index), 0) + begin
+        lines = arr[index]
+        means = []
+        for line in (np.power(lines, 2), lines):
+            line = line.astype(np.float64)
+            sums = np.add.accumulate(
+                np.concatenate((line[:, :win_sz], line[:, win_sz:] - line[:, :-win_sz]), axis=1), axis=1
+            )
+            means.append((sums[:, win_sz - 1 + win_sz // 2 + offsets] / win_sz).astype(arr.dtype))
+        rms_db = level2db(np.sqrt(means[0] - np.power(means[1], 2)))
+        rms_db[offsets > length - win_sz] = np.inf
+        positions[i: i + batch] = np.argmin(rms_db, axis=1)
+    return positions
+
+
 def level2db(levels, eps=1e-12):
     return 20 * np.log10(np.clip(levels, a_min=eps, a_max=1))
 
@@ -57,57 +81,27 @@ class Slicer:
         if not self.max_silence >= self.win_sn:
             raise ValueError('The following condition must be satisfied: max_silence_kept >= win_s')
 
-    @timeit
     def slice(self, audio):
         if len(audio.shape) > 1:
-            samples = librosa.to_mono(audio)
+            with stage('downmix'):
+                samples = np.mean(audio, axis=0)
         else:
             samples = audio
         if samples.shape[0] <= self.min_samples:
+            count('clips')
             return [audio]
-        # get absolute amplitudes
-        abs_amp = np.abs(samples - np.mean(samples))
-        # calculate local maximum with large window
-        win_max_db = level2db(_window_maximum(abs_amp, win_sz=self.win_ln))
-        sil_tags = []
-        left = right = 0
-        while right < win_max_db.shape[0]:
-            if win_max_db[right] < self.db_threshold:
-                right += 1
-            elif left == right:
-                left += 1
-                right += 1
-            else:
-                if left == 0:
-                    split_loc_l = left
-                else:
-                    sil_left_n = min(self.max_silence, (right + self.win_ln - left) // 2)
-                    rms_db_left = level2db(_window_rms(samples[left: left + sil_left_n], win_sz=self.win_sn))
-                    split_win_l = left + np.argmin(rms_db_left)
-                    split_loc_l = split_win_l + np.argmin(abs_amp[split_win_l: split_win_l + self.win_sn])
-                if len(sil_tags) != 0 and split_loc_l - sil_tags[-1][1] < self.min_samples and right < win_max_db.shape[0] - 1:
-                    right += 1
-                    left = right
-                    continue
-                if right == win_max_db.shape[0] - 1:
-                    split_loc_r = right + self.win_ln
-                else:
-                    sil_right_n = min(self.max_silence, (right + self.win_ln - left) // 2)
-                    rms_db_right = level2db(_window_rms(samples[right + self.win_ln - sil_right_n: right + self.win_ln], win_sz=self.win_sn))
-                    split_win_r = right + self.win_ln - sil_right_n + np.argmin(rms_db_right)
-                    split_loc_r = split_win_r + np.argmin(abs_amp[split_win_r: split_win_r + self.win_sn])
-                sil_tags.append((split_loc_l, split_loc_r))
-                right += 1
-                left = right
-        if left != right:
-            sil_left_n = min(self.max_silence, (right + self.win_ln - left) // 2)
-            rms_db_left = level2db(_window_rms(samples[left: left + sil_left_n], win_sz=self.win_sn))
-            split_win_l = left + np.argmin(rms_db_left)
-            split_loc_l = split_win_l + np.argmin(abs_amp[split_win_l: split_win_l + self.win_sn])
-            sil_tags.append((split_loc_l, samples.shape[0]))
+        with stage('rms'):
+            # get absolute amplitudes
+            abs_amp = np.abs(samples - np.mean(samples))
+            # calculate local maximum with large window
+            win_max_db = level2db(_window_maximum(abs_amp, win_sz=self.win_ln))
+        count('frames', win_max_db.shape[0])
+        with stage('state_machine'):
+            sil_tags = self._get_sil_tags(samples, abs_amp, win_max_db)
         if len(sil_tags) == 0:
+            count('clips')
             return [audio]
-        else:
+        with stage('slice'):
             chunks = []
             if sil_tags[0][0] > 0:
                 chunks.append(_apply_slice(audio, 0, sil_tags[0][0]))
@@ -115,36 +109,96 @@ class Slicer:
                 chunks.append(_apply_slice(audio, sil_tags[i][1], sil_tags[i + 1][0]))
             if sil_tags[-1][1] < samples.shape[0] - 1:
                 chunks.append(_apply_slice(audio, sil_tags[-1][1], samples.shape[0]))
-            return chunks
+        count('clips', len(chunks))
+        return chunks
+
+    def _get_sil_tags(self, samples, abs_amp, win_max_db):
+        # Silent runs [left, right) of the large window maximum, found in one pass
+        num_windows = win_max_db.shape[0]
+        silent = np.concatenate(([False], win_max_db < self.db_threshold, [False]))
+        edges = np.flatnonzero(silent[1:] != silent[:-1])
+        lefts, rights = edges[::2], edges[1::2]
+        count('silence_runs', lefts.shape[0])
+        # Both sides of a silence are searched for the split location within the same number of samples
+        sil_ns = np.minimum(self.max_silence, (rights + self.win_ln - lefts) // 2)
+        need_l = np.flatnonzero((lefts > 0) | (rights == num_windows))
+        need_r = np.flatnonzero(rights < num_windows - 1)
+        split_locs_l = self._find_split_locs(samples, abs_amp, lefts, sil_ns, need_l)
+        split_locs_r = self._find_split_locs(samples, abs_amp, rights + self.win_ln - sil_ns, sil_ns, need_r)
+        sil_tags = []
+        for i in range(lefts.shape[0]):
+            left, right, sil_n = int(lefts[i]), int(rights[i]), int(sil_ns[i])
+            if left == 0 and right < num_windows:
+                split_loc_l = left
+            else:
+                split_loc_l = split_locs_l[i]
+                if split_loc_l is None:
+                    split_loc_l = self._find_split_loc(samples, abs_amp, left, sil_n)
+            if right == num_windows:
+                # trailing silence
+                sil_tags.append((split_loc_l, samples.shape[0]))
+                break
+            if len(sil_tags) != 0 and split_loc_l - sil_tags[-1][1] < self.min_samples and right < num_windows - 1:
+                continue
+            if right == num_windows - 1:
+                split_loc_r = right + self.win_ln
+            else:
+                split_loc_r = split_locs_r[i]
+                if split_loc_r is None:
+                    split_loc_r = self._find_split_loc(samples, abs_amp, right + self.win_ln - sil_n, sil_n)
+            sil_tags.append((split_loc_l, split_loc_r))
+        return sil_tags
+
+    def _find_split_loc(self, samples, abs_amp, begin, sil_n):
+        rms_db = level2db(_window_rms(samples[begin: begin + sil_n], win_sz=self.win_sn))
+        split_win = begin + np.argmin(rms_db)
+        return int(split_win + np.argmin(abs_amp[split_win: split_win + self.win_sn]))
+
+    def _find_split_locs(self, samples, abs_amp, begins, sil_ns, indices):
+        # _find_split_loc() of the given silences, all computed at once. Silences shorter than the small window
+        # are left as None, for _find_split_loc() to fail on them only when they are actually needed.
+        split_locs = [None] * begins.shape[0]
+        indices = indices[sil_ns[indices] >= self.win_sn]
+        split_wins = begins[indices] + _window_rms_argmin(samples, begins[indices], sil_ns[indices], self.win_sn)
+        split_wins += np.argmin(abs_amp[split_wins[:, None] + np.arange(self.win_sn)], axis=1)
+        for i, split_loc in zip(indices.tolist(), split_wins.tolist()):
+            split_locs[i] = split_loc
+        return split_locs
 
 
 def main():
     parser = ArgumentParser()
     parser.add_argument('audio', type=str, help='The audio to be sliced')
     parser.add_argument('--out', type=str, help='Output directory of the sliced audio clips')
+    parser.add_argument('--sr', type=int, required=False, help='Resample the audio to this sample rate before slicing, defaults to the original one')
     parser.add_argument('--db_thresh', type=float, required=False, default=-40, help='The dB threshold for silence detection')
     parser.add_argument('--min_len', type=int, required=False, default=5000, help='The minimum milliseconds required for each sliced audio clip')
     parser.add_argument('--win_l', type=int, required=False, default=300, help='Size of the large sliding window, presented in milliseconds')
     parser.add_argument('--win_s', type=int, required=False, default=20, help='Size of the small sliding window, presented in milliseconds')
     parser.add_argument('--max_sil_kept', type=int, required=False, default=500, help='The maximum silence length kept around the sliced audio, presented in milliseconds')
+    parser.add_argument('--profile', type=str, required=False, help='Write the time spent in each stage of slicing to this JSON file')
     args = parser.parse_args()
     out = args.out
     if out is None:
         out = os.path.dirname(os.path.abspath(args.audio))
-    audio, sr = librosa.load(args.audio, sr=None)
-    slicer = Slicer(
-        sr=sr,
-        db_threshold=args.db_thresh,
-        min_length=args.min_len,
-        win_l=args.win_l,
-        win_s=args.win_s,
-        max_silence_kept=args.max_sil_kept
-    )
-    chunks = slicer.slice(audio)
-    if not os.path.exists(out):
-        os.makedirs(out)
-    for i, chunk in enumerate(chunks):
-        soundfile.write(os.path.join(out, f'%s_%d.wav' % (os.path.basename(args.audio).rsplit('.', maxsplit=1)[0], i)), chunk, sr)
+    with profile() as profiler:
+        audio, sr = load_audio(args.audio, sr=args.sr)
+        slicer = Slicer(
+            sr=sr,
+            db_threshold=args.db_thresh,
+            min_length=args.min_len,
+            win_l=args.win_l,
+            win_s=args.win_s,
+            max_silence_kept=args.max_sil_kept
+        )
+        chunks = slicer.slice(audio)
+        if not os.path.exists(out):
+            os.makedirs(out)
+        for i, chunk in enumerate(chunks):
+            with stage('encode'):
+                soundfile.write(os.path.join(out, f'%s_%d.wav' % (os.path.basename(args.audio).rsplit('.', maxsplit=1)[0], i)), chunk, sr)
+    if args.profile is not None:
+        write_summary(args.profile, profiler)
 
 
 if __name__ == '__main__':
@@ -4,6 +4,11 @@ from argparse import ArgumentParser
 import numpy as np
 import soundfile
 
+from envelope import EnvelopeCache
+from pipeline import PipelineExecutor, prefetch
+from profiler import Profiler, count, profile, stage, write_summary
+from wavmap import MappedWav, map_wav
+
 
 # This function is obtained from librosa.
 def get_rms(
@@ -12,10 +17,18 @@ def get_rms(
     frame_length=2048,
     hop_length=512,
     pad_mode="constant",
+    method="strided",
 ):
     padding = (int(frame_length // 2), int(frame_length // 2))
     y = np.pad(y, padding, mode=pad_mode)
+    return _get_padded_rms(y, frame_length=frame_length, hop_length=hop_length, method=method)
+
 
+def _get_padded_rms(y, *, frame_length, hop_length, method="strided"):
+    if method == "sliding":
+        return _get_sliding_rms(y, frame_length=frame_length, hop_length=hop_length)
+    if method != "strided":
+        raise ValueError(f'Unknown RMS method: {method}')
     axis = -1
     # put our new within-frame axis at the end for now
     out_strides = y.strides + tuple([y.strides[axis]])
@@ -42,6 +55,84 @@ def get_rms(
     return np.sqrt(power)
 
 
+def _get_sliding_rms(y, *, frame_length, hop_length, block_frames=65536):
+    # O(n) equivalent of the strided RMS above for 1-D input. Each window is split into whole hops plus a partial
+    # hop, whose sums of squares are accumulated in float64 and shared between overlapping windows. Frames are
+    # processed in blocks so that no temporary is larger than a block.
+    num_frames = max(0, 1 + (y.shape[-1] - frame_length) // hop_length)
+    num_hops, remainder = divmod(frame_length, hop_length)
+    dtype = y.dtype if np.issubdtype(y.dtype, np.floating) else np.float64
+    power = np.empty((1, num_frames), dtype=dtype)
+    for begin in range(0, num_frames, block_frames):
+        count = min(num_frames, begin + block_frames) - begin
+        segment = y[begin * hop_length: (begin + count - 1) * hop_length + frame_length]
+        hops = segment[:(count - 1 + num_hops) * hop_length].reshape(-1, hop_length)
+        hop_sums = np.einsum('ij,ij->i', hops, hops, dtype=np.float64)
+        window_sums = np.zeros(count, dtype=np.float64)
+        if remainder > 0:
+            # The partial hop of every window, taken the same way so that frames do not depend on the block.
+            partial = np.lib.stride_tricks.as_strided(
+                segment[num_hops * hop_length:], shape=(count, remainder),
+                strides=(segment.strides[0] * hop_length, segment.strides[0])
+            )
+            window_sums[:] = np.einsum('ij,ij->i', partial, partial, dtype=np.float64)
+        for i in range(num_hops):
+            window_sums += hop_sums[i: i + count]
+        power[0, begin: begin + count] = window_sums / frame_length
+    return np.sqrt(power)
+
+
+def _segment_argmin(values, begins, ends):
+    # Index of the first minimum of values[begins[k]: ends[k]] for every k, without looping over the segments.
+    if begins.shape[0] == 0:
+        return begins
+    lengths = ends - begins
+    offsets = np.concatenate(([0], np.cumsum(lengths[:-1])))
+    segments = np.repeat(np.arange(begins.shape[0]), lengths)
+    indices = np.arange(lengths.sum()) + np.repeat(begins - offsets, lengths)
+    selected = values[indices]
+    minima = np.minimum.reduceat(selected, offsets)
+    matches = np.flatnonzero(selected == minima[segments])
+    _, first = np.unique(segments[matches], return_index=True)
+    return indices[matches[first]]
+
+
+def _get_rms_batch(signals, *, frame_length, hop_length, method="strided", batch_size=1 << 20):
+    # Same as get_rms() of each 1-D signal, but frames many signals at once. Signals of the same dtype are padded and
+    # laid out at multiples of hop_length in a shared buffer of about batch_size samples, so that the frames of each
+    # signal are frames of the buffer.
+    pad = frame_length // 2
+    rms_lists = [None] * len(signals)
+    groups = {}
+    for i, signal in enumerate(signals):
+        groups.setdefault(signal.dtype, []).append(i)
+    for dtype, indices in groups.items():
+        begin = 0
+        while begin < len(indices):
+            offsets = []
+            size = 0
+            end = begin
+            while end < len(indices) and (end == begin or size < batch_size):
+                offsets.append(size)
+                size += -(-(signals[indices[end]].shape[0] + 2 * pad) // hop_length) * hop_length
+                end += 1
+            buffer = np.zeros(size, dtype=dtype)
+            for i, offset in zip(indices[begin: end], offsets):
+                buffer[offset + pad: offset + pad + signals[i].shape[0]] = signals[i]
+            rms_list = _get_padded_rms(buffer, frame_length=frame_length, hop_length=hop_length, method=method)[0]
+            for i, offset in zip(indices[begin: end], offsets):
+                num_frames = 1 + (signals[i].shape[0] + 2 * pad - frame_length) // hop_length
+                rms_lists[i] = rms_list[offset // hop_length: offset // hop_length + num_frames]
+            begin = end
+    return rms_lists
+
+
+# Engines of the Slicer state machine, see Slicer.backend.
+BACKENDS = ('numpy', 'numba')
+# Silence searches of Slicer.get_boundaries(), see Slicer.search.
+SEARCHES = ('exhaustive', 'coarse_to_fine')
+
+
 class Slicer:
     def __init__(self,
                  sr: int,
@@ -49,7 +140,17 @@ class Slicer:
                  min_length: int = 5000,
                  min_interval: int = 300,
                  hop_size: int = 20,
-                 max_sil_kept: int = 5000):
+                 max_sil_kept: int = 5000,
+                 rms_method: str = 'strided',
+                 channel_policy='mean',
+                 backend: str = 'numpy',
+                 search: str = 'exhaustive'):
+        if channel_policy not in ('mean', 'max') and not isinstance(channel_policy, int):
+            raise ValueError(f'Unknown channel policy: {channel_policy}')
+        if backend not in BACKENDS:
+            raise ValueError(f'Unknown backend: {backend}')
+        if search not in SEARCHES:
+            raise ValueError(f'Unknown search: {search}')
         if not min_length >= min_interval >= hop_size:
             raise ValueError('The following condition must be satisfied: min_length >= min_interval >= hop_size')
         if not max_sil_kept >= hop_size:
@@ -61,93 +162,1195 @@ class Slicer:
         self.min_length = round(sr * min_length / 1000 / self.hop_size)
         self.min_interval = round(min_interval / self.hop_size)
         self.max_sil_kept = round(sr * max_sil_kept / 1000 / self.hop_size)
+        self.rms_method = rms_method
+        # How the channels of multichannel audio make up the envelope: 'mean' takes the RMS of their mean, 'max' the
+        # RMS of the loudest channel in each frame (a frame is silent only if all channels are), and an int the RMS
+        # of that channel alone.
+        self.channel_policy = channel_policy
+        # How the silences are found from the envelope: 'numpy' runs the vectorized state machine, 'numba' the frame
+        # loop compiled by numba (see kernels.py), which falls back to 'numpy' if numba cannot be imported. Both give
+        # the same clips.
+        self.backend = backend
+        if backend == 'numba':
+            try:
+                import kernels
+            except ImportError as e:
+                import warnings
+                warnings.warn(f'Cannot use the numba backend ({e}), falling back to numpy')
+                self.backend = 'numpy'
+        # How much of the envelope get_boundaries() computes: 'exhaustive' computes every frame, 'coarse_to_fine'
+        # only the frames that get_rms_sparse() cannot rule out as silence. Both give the same clips.
+        self.search = search
 
-    def _apply_slice(self, waveform, begin, end):
+    def _get_sil_tags(self, rms_list):
+        if self.backend == 'numba':
+            import kernels
+            sil_tags, num_runs = kernels.get_sil_tags(
+                rms_list, rms_list.dtype.type(self.threshold), self.min_interval, self.min_length, self.max_sil_kept
+            )
+            count('silence_runs', num_runs)
+            return [(begin, end) for begin, end in sil_tags.tolist()]
+        # Run-length encode the silent frames into runs of [silence_start, silence_end).
+        total_frames = rms_list.shape[0]
+        silent = np.concatenate(([False], rms_list < self.threshold, [False]))
+        edges = np.flatnonzero(silent[1:] != silent[:-1])
+        silence_starts, silence_ends = edges[::2], edges[1::2]
+        count('silence_runs', silence_starts.shape[0])
+        trailing_start = None
+        if silence_ends.shape[0] > 0 and silence_ends[-1] == total_frames:
+            trailing_start = silence_starts[-1]
+            silence_starts, silence_ends = silence_starts[:-1], silence_ends[:-1]
+        # Drop silences that can never be sliced: those neither leading nor longer than min_interval.
+        lengths = silence_ends - silence_starts
+        is_leading = (silence_starts == 0) & (silence_ends > self.max_sil_kept)
+        keep = is_leading | (lengths >= self.min_interval)
+        silence_starts, silence_ends, lengths, is_leading = \
+            silence_starts[keep], silence_ends[keep], lengths[keep], is_leading[keep]
+        # Record the range of silent frames to be removed if each silence were sliced.
+        tag_begins = np.empty_like(silence_starts)
+        tag_ends = np.empty_like(silence_starts)
+        short = lengths <= self.max_sil_kept
+        pos = _segment_argmin(rms_list, silence_starts[short], silence_ends[short] + 1)
+        tag_begins[short] = tag_ends[short] = pos
+        long = ~short
+        tag_begins[long] = _segment_argmin(
+            rms_list, silence_starts[long], silence_starts[long] + self.max_sil_kept + 1
+        )
+        tag_ends[long] = _segment_argmin(rms_list, silence_ends[long] - self.max_sil_kept, silence_ends[long] + 1)
+        middle = long & (lengths <= self.max_sil_kept * 2) & (silence_starts > 0)
+        pos = _segment_argmin(
+            rms_list, silence_ends[middle] - self.max_sil_kept, silence_starts[middle] + self.max_sil_kept + 1
+        )
+        tag_begins[middle] = np.minimum(tag_begins[middle], pos)
+        tag_ends[middle] = np.maximum(tag_ends[middle], pos)
+        tag_begins[silence_starts == 0] = 0
+        # Only this part depends on the previous slice: the clip must reach min_length before slicing again.
+        sil_tags = []
+        clip_start = 0
+        for silence_end, tag_begin, tag_end, leading in zip(
+                silence_ends.tolist(), tag_begins.tolist(), tag_ends.tolist(), is_leading.tolist()
+        ):
+            if leading or silence_end - clip_start >= self.min_length:
+                sil_tags.append((tag_begin, tag_end))
+                clip_start = tag_end
+        # Deal with trailing silence.
+        if trailing_start is not None and total_frames - trailing_start >= self.min_interval:
+            silence_end = min(total_frames, trailing_start + self.max_sil_kept)
+            pos = rms_list[trailing_start: silence_end + 1].argmin() + trailing_start
+            sil_tags.append((int(pos), total_frames + 1))
+        return sil_tags
+
+    def get_boundaries(self, waveform, channels_last=False, block_size=1 << 18, jobs=1):
+        # (begin, end) sample ranges of the clips returned by slice(), without touching the audio itself.
+        # Multichannel waveforms are (channels, samples), or (samples, channels) as read by soundfile if channels_last.
+        # With jobs other than 1, the envelope is computed by get_rms_parallel(), or get_rms_sparse() with the coarse
+        # to fine search.
+        num_samples = waveform.shape[0 if channels_last else -1]
+        if (num_samples + self.hop_size - 1) // self.hop_size <= self.min_length:
+            count('clips')
+            return [(0, num_samples)]
+        if self.search == 'coarse_to_fine':
+            rms_list = self.get_rms_sparse(waveform, channels_last=channels_last, jobs=jobs)
+            return self.get_boundaries_from_rms(rms_list, num_samples)
+        if jobs != 1:
+            rms_list = self.get_rms_parallel(waveform, channels_last=channels_last, jobs=jobs)
+            return self.get_boundaries_from_rms(rms_list, num_samples)
         if len(waveform.shape) > 1:
-            return waveform[:, begin * self.hop_size: min(waveform.shape[1], end * self.hop_size)]
+            # Reduce the channels block by block rather than making a mono copy of the whole waveform.
+            rms_list, _ = self.get_rms_stream(
+                (_slice_samples(waveform, i, i + block_size, channels_last) for i in range(0, num_samples, block_size)),
+                channels_last=channels_last
+            )
+            return self.get_boundaries_from_rms(rms_list, num_samples)
+        with stage('rms'):
+            rms_list = get_rms(
+                y=waveform, frame_length=self.win_size, hop_length=self.hop_size, method=self.rms_method
+            ).squeeze(0)
+        return self.get_boundaries_from_rms(rms_list, num_samples)
+
+    def get_boundaries_from_rms(self, rms_list, num_samples):
+        # Same as get_boundaries(), but from a precomputed RMS envelope of a waveform of num_samples samples.
+        if (num_samples + self.hop_size - 1) // self.hop_size <= self.min_length:
+            count('clips')
+            return [(0, num_samples)]
+        with stage('state_machine'):
+            sil_tags = self._get_sil_tags(rms_list)
+        total_frames = rms_list.shape[0]
+        count('frames', total_frames)
+        if len(sil_tags) == 0:
+            count('clips')
+            return [(0, num_samples)]
+        clips = []
+        if sil_tags[0][0] > 0:
+            clips.append((0, sil_tags[0][0]))
+        for i in range(len(sil_tags) - 1):
+            clips.append((sil_tags[i][1], sil_tags[i + 1][0]))
+        if sil_tags[-1][1] < total_frames:
+            clips.append((sil_tags[-1][1], total_frames))
+        count('clips', len(clips))
+        return [(int(begin * self.hop_size), int(min(num_samples, end * self.hop_size))) for begin, end in clips]
+
+    def slice(self, waveform, channels_last=False, jobs=1):
+        # Clips are views of the waveform, in its own layout.
+        boundaries = self.get_boundaries(waveform, channels_last=channels_last, jobs=jobs)
+        with stage('slice'):
+            return [_slice_samples(waveform, begin, end, channels_last) for begin, end in boundaries]
+
+    def get_rms_parallel(self, waveform, channels_last=False, jobs=None, segment_size=1 << 20):
+        # The RMS envelope used by get_boundaries(), computed by jobs threads (the CPU count if None) over segments of
+        # about segment_size samples. Each thread reads its segment plus the half windows around it, so that the
+        # frames are exactly those of the whole waveform and the envelopes of the segments are simply joined. The
+        # threads share the waveform, which may also be a MappedWav decoded segment by segment, and numpy releases
+        # the GIL while they frame it.
+        from concurrent.futures import ThreadPoolExecutor
+        if isinstance(waveform, MappedWav):
+            read = waveform.read
+            num_samples = waveform.frames
+            channels_last = True
         else:
-            return waveform[begin * self.hop_size: min(waveform.shape[0], end * self.hop_size)]
+            read = lambda begin, end: _slice_samples(waveform, begin, end, channels_last)
+            num_samples = waveform.shape[0 if channels_last else -1]
+        framer = _EnvelopeFramer(self, channels_last=channels_last)
+        pad = self.win_size // 2
+        num_frames = 1 + (num_samples + 2 * pad - self.win_size) // self.hop_size
+        segment_frames = max(1, segment_size // self.hop_size)
 
-    # @timeit
-    def slice(self, waveform):
-        if len(waveform.shape) > 1:
-            samples = waveform.mean(axis=0)
+        def get_segment_rms(begin_frame):
+            end_frame = min(num_frames, begin_frame + segment_frames)
+            # The padded samples of the frames, zero outside of the waveform like in get_rms().
+            begin = begin_frame * self.hop_size - pad
+            end = (end_frame - 1) * self.hop_size - pad + self.win_size
+            signals = framer.get_signals(read(max(0, begin), min(num_samples, end)))
+            with stage('rms'):
+                return framer.reduce([
+                    _get_padded_rms(
+                        np.pad(signal, (max(0, -begin), max(0, end - num_samples))), frame_length=self.win_size,
+                        hop_length=self.hop_size, method=self.rms_method
+                    )[0]
+                    for signal in signals
+                ])
+
+        if num_frames <= 0:
+            return np.zeros(0, dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+            return np.concatenate(list(executor.map(get_segment_rms, range(0, num_frames, segment_frames))))
+
+    def get_rms_sparse(self, waveform, channels_last=False, step=4, block_size=1 << 20, merge=16, jobs=1):
+        # The RMS envelope used by get_boundaries(), computed only where there may be silence; the other frames are
+        # inf. A first pass over every step-th sample (blocks of about block_size samples) gives a lower bound of
+        # the energy of every frame, from the hops that lie within it, and rules out the frames whose bound is
+        # clearly above the threshold. The frames left, in runs joined across gaps of less than merge frames, are
+        # then computed like in get_rms_parallel(), so they are exactly those of the whole envelope. As the frames
+        # ruled out are louder than any silent frame, the state machine finds the same silences and the same
+        # minima in them. The waveform may also be a MappedWav. Both passes are split between jobs threads (the CPU
+        # count if None) like in get_rms_parallel().
+        from concurrent.futures import ThreadPoolExecutor
+        if isinstance(waveform, MappedWav):
+            read = waveform.read
+            num_samples = waveform.frames
+            channels_last = True
         else:
-            samples = waveform
-        if (samples.shape[0] + self.hop_size - 1) // self.hop_size <= self.min_length:
-            return [waveform]
-        rms_list = get_rms(y=samples, frame_length=self.win_size, hop_length=self.hop_size).squeeze(0)
-        sil_tags = []
-        silence_start = None
-        clip_start = 0
-        for i, rms in enumerate(rms_list):
-            # Keep looping while frame is silent.
-            if rms < self.threshold:
-                # Record start of silent frames.
-                if silence_start is None:
-                    silence_start = i
-                continue
-            # Keep looping while frame is not silent and silence start has not been recorded.
-            if silence_start is None:
+            read = lambda begin, end, step=1: \
+                waveform[begin: end: step] if channels_last else waveform[..., begin: end: step]
+            num_samples = waveform.shape[0 if channels_last else -1]
+        framer = _EnvelopeFramer(self, channels_last=channels_last)
+        hop_size, win_size = self.hop_size, self.win_size
+        pad = win_size // 2
+        num_frames = max(0, 1 + (num_samples + 2 * pad - win_size) // hop_size)
+        block_size = max(1, block_size // hop_size) * hop_size
+
+        def get_hop_bounds(begin):
+            # Lower bounds of the sums of squares of the hops of each signal in the block
+            end = min(num_samples, begin + block_size)
+            signals = framer.get_signals(read(begin, end, step))
+            starts = np.arange(0, end - begin, hop_size)
+            if step > hop_size:
+                return np.zeros((len(signals), starts.shape[0]), dtype=np.float64)
+            # A trailing zero for the last hop, which may have no sample left
+            return np.stack([
+                np.add.reduceat(np.concatenate((signal.astype(np.float64) ** 2, [0.])), -(-starts // step))
+                for signal in signals
+            ])
+
+        def get_run_rms(run):
+            begin_frame, end_frame = run
+            begin = begin_frame * hop_size - pad
+            end = (end_frame - 1) * hop_size - pad + win_size
+            signals = framer.get_signals(read(max(0, begin), min(num_samples, end)))
+            with stage('rms'):
+                return framer.reduce([
+                    _get_padded_rms(
+                        np.pad(signal, (max(0, -begin), max(0, end - num_samples))), frame_length=win_size,
+                        hop_length=hop_size, method=self.rms_method
+                    )[0]
+                    for signal in signals
+                ])
+
+        if num_samples == 0:
+            return np.zeros(0, dtype=np.float32)
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+            with stage('coarse'):
+                hop_bounds = np.concatenate(list(executor.map(get_hop_bounds, range(0, num_samples, block_size))),
+                                            axis=1)
+                num_hops = hop_bounds.shape[1]
+                # Frame i covers the samples [i * hop_size - pad, i * hop_size - pad + win_size), zero outside of
+                # the waveform, hence the hops [i - pad // hop_size, i + (win_size - pad) // hop_size)
+                first, last = -(pad // hop_size), (win_size - pad) // hop_size
+                padded = np.zeros((hop_bounds.shape[0], num_frames + last - first), dtype=np.float64)
+                length = min(num_hops, padded.shape[1] + first)
+                padded[:, -first: -first + length] = hop_bounds[:, :length]
+                frame_bounds = np.zeros((hop_bounds.shape[0], num_frames), dtype=np.float64)
+                for i in range(last - first):
+                    frame_bounds += padded[:, i: i + num_frames]
+                # With a margin for the rounding of the RMS frames, well above float32 precision
+                loud = frame_bounds.max(axis=0) >= self.threshold ** 2 * win_size * (1 + 1e-4)
+            candidates = np.concatenate(([False], ~loud, [False]))
+            edges = np.flatnonzero(candidates[1:] != candidates[:-1])
+            begins, ends = edges[::2], edges[1::2]
+            keep = np.concatenate((begins[:1] >= 0, begins[1:] - ends[:-1] >= merge))
+            begins, ends = begins[keep], np.concatenate((ends[np.flatnonzero(keep)[1:] - 1], ends[-1:]))
+            runs = list(zip(begins.tolist(), ends.tolist()))
+            rms_list = None
+            for (begin_frame, end_frame), run in zip(runs, executor.map(get_run_rms, runs)):
+                if rms_list is None:
+                    rms_list = np.full(num_frames, np.inf, dtype=run.dtype)
+                rms_list[begin_frame: end_frame] = run
+        count('refined_frames', int((ends - begins).sum()))
+        return np.full(num_frames, np.inf, dtype=np.float32) if rms_list is None else rms_list
+
+    def get_boundaries_batch(self, waveforms, channels_last=False):
+        # Same as get_boundaries() of each waveform, but computes the RMS envelopes of all of them in one pass, which
+        # saves most of the overhead of each call on many short waveforms.
+        waveforms = list(waveforms)
+        framer = _EnvelopeFramer(self, channels_last=channels_last)
+        num_samples = []
+        signals = []
+        owners = []
+        for i, waveform in enumerate(waveforms):
+            num_samples.append(waveform.shape[0 if channels_last else -1])
+            if (num_samples[i] + self.hop_size - 1) // self.hop_size <= self.min_length:
+                # Kept whole without computing its envelope
                 continue
-            # Clear recorded silence start if interval is not enough or clip is too short
-            is_leading_silence = silence_start == 0 and i > self.max_sil_kept
-            need_slice_middle = i - silence_start >= self.min_interval and i - clip_start >= self.min_length
-            if not is_leading_silence and not need_slice_middle:
-                silence_start = None
+            for signal in framer.get_signals(waveform):
+                signals.append(signal)
+                owners.append(i)
+        with stage('rms'):
+            rms_lists = _get_rms_batch(
+                signals, frame_length=self.win_size, hop_length=self.hop_size, method=self.rms_method
+            )
+            envelopes = [[] for _ in waveforms]
+            for i, rms_list in zip(owners, rms_lists):
+                envelopes[i].append(rms_list)
+            envelopes = [framer.reduce(rms_lists) if rms_lists else None for rms_lists in envelopes]
+        return [self.get_boundaries_from_rms(rms_list, n) for rms_list, n in zip(envelopes, num_samples)]
+
+    def slice_batch(self, waveforms, channels_last=False):
+        # Same as slice() of each waveform, with the envelopes computed like get_boundaries_batch().
+        waveforms = list(waveforms)
+        boundaries = self.get_boundaries_batch(waveforms, channels_last=channels_last)
+        with stage('slice'):
+            return [
+                [_slice_samples(waveform, begin, end, channels_last) for begin, end in clips]
+                for waveform, clips in zip(waveforms, boundaries)
+            ]
+
+    def slice_stream(self, blocks, channels_last=False):
+        # Same as slice(), but consumes the waveform block by block and yields each clip once its end is known.
+        # Blocks are shaped like the waveforms accepted by slice(), i.e. (samples,) or (channels, samples), or
+        # (samples, channels) if channels_last.
+        stream = StreamingSlicer(self, channels_last=channels_last)
+        for block in blocks:
+            yield from stream.feed(block)
+        yield from stream.flush()
+
+    def get_rms_stream(self, blocks, channels_last=False):
+        # The RMS envelope used by get_boundaries() and the number of samples, computed block by block.
+        framer = _EnvelopeFramer(self, channels_last=channels_last)
+        rms_lists = []
+        num_samples = 0
+        for block in blocks:
+            num_samples += block.shape[0 if channels_last else -1]
+            rms_lists.append(framer.feed(block))
+        if num_samples == 0:
+            return np.zeros(0, dtype=np.float32), 0
+        rms_lists.append(framer.flush())
+        return np.concatenate(rms_lists), num_samples
+
+    def get_boundaries_stream(self, blocks, channels_last=False):
+        # Same as get_boundaries(), but consumes the waveform block by block like slice_stream() and buffers no audio.
+        stream = _SliceStream(self, keep_audio=False, channels_last=channels_last)
+        for block in blocks:
+            yield from stream.feed(block)
+        yield from stream.flush()
+
+
+class StreamingSlicer:
+    # Push-based slice() for live audio. feed() takes the next block of the waveform and returns the clips finalized
+    # so far, flush() ends the waveform and returns the remaining clips; together they are exactly the clips slice()
+    # returns for the whole waveform. Blocks are shaped like in slice_stream() and may have any number of samples.
+    # A clip is finalized once the silence after it has lasted max(min_interval, 2 * max_sil_kept + 1) hops (plus
+    # half a window for the RMS frames) and the clip has reached min_length, as the slicing position depends on
+    # that much of the silence. Only the audio of the clip being recorded is buffered.
+    # After flush(), the slicer can be fed the next waveform.
+    def __init__(self, slicer: Slicer, channels_last: bool = False):
+        self.slicer = slicer
+        self.channels_last = channels_last
+        self.stream = _SliceStream(slicer, channels_last=channels_last)
+
+    def feed(self, block):
+        return self.stream.feed(block)
+
+    def flush(self):
+        chunks = self.stream.flush()
+        self.stream = _SliceStream(self.slicer, channels_last=self.channels_last)
+        return chunks
+
+
+class _RmsFramer:
+    # Computes the same RMS frames as get_rms() from consecutive blocks of mono samples.
+    def __init__(self, slicer: Slicer):
+        self.slicer = slicer
+        # Samples not yet framed, starting from the padded position of the next frame.
+        self.pending = None
+
+    def feed(self, samples):
+        if self.pending is None:
+            self.pending = np.zeros(self.slicer.win_size // 2, dtype=samples.dtype)
+        self.pending = np.concatenate((self.pending, samples))
+        return self._frame()
+
+    def flush(self):
+        if self.pending is None:
+            return None
+        self.pending = np.concatenate((self.pending, np.zeros(self.slicer.win_size // 2, dtype=self.pending.dtype)))
+        return self._frame()
+
+    def _frame(self):
+        hop_size = self.slicer.hop_size
+        win_size = self.slicer.win_size
+        if self.pending.shape[0] < win_size:
+            return self.pending[:0]
+        count = (self.pending.shape[0] - win_size) // hop_size + 1
+        rms_list = _get_padded_rms(
+            self.pending[:(count - 1) * hop_size + win_size], frame_length=win_size, hop_length=hop_size,
+            method=self.slicer.rms_method
+        ).squeeze(0)
+        self.pending = self.pending[count * hop_size:]
+        return rms_list
+
+
+def _slice_samples(audio, begin, end, channels_last=False):
+    return audio[begin: end] if channels_last else audio[..., begin: end]
+
+
+class _EnvelopeFramer:
+    # Computes the RMS envelope of consecutive blocks of audio, reducing the channels by the channel policy of the
+    # slicer. Channels are taken as views of each block, so interleaved audio is never transposed.
+    def __init__(self, slicer: Slicer, channels_last: bool = False):
+        self.slicer = slicer
+        self.channels_last = channels_last
+        self.framers = None
+
+    def feed(self, block):
+        signals = self.get_signals(block)
+        if self.framers is None:
+            self.framers = [_RmsFramer(self.slicer) for _ in signals]
+        with stage('rms'):
+            return self.reduce([framer.feed(signal) for framer, signal in zip(self.framers, signals)])
+
+    def flush(self):
+        if self.framers is None:
+            return None
+        with stage('rms'):
+            return self.reduce([framer.flush() for framer in self.framers])
+
+    def get_signals(self, block):
+        policy = self.slicer.channel_policy
+        if len(block.shape) == 1:
+            num_channels = 1
+        else:
+            num_channels = block.shape[-1 if self.channels_last else 0]
+        if num_channels == 1:
+            return [block.reshape(-1)]
+        if isinstance(policy, int) and not 0 <= policy < num_channels:
+            raise ValueError(f'Channel {policy} is out of range for audio with {num_channels} channels')
+        if policy == 'mean':
+            with stage('downmix'):
+                return [block.mean(axis=-1 if self.channels_last else 0)]
+        channels = [policy] if isinstance(policy, int) else range(num_channels)
+        return [block[:, c] if self.channels_last else block[c] for c in channels]
+
+    @staticmethod
+    def reduce(rms_lists):
+        if len(rms_lists) == 1:
+            return rms_lists[0]
+        return np.maximum.reduce(rms_lists)
+
+
+class _SliceStream:
+    def __init__(self, slicer: Slicer, keep_audio: bool = True, channels_last: bool = False):
+        self.slicer = slicer
+        self.keep_audio = keep_audio
+        self.channels_last = channels_last
+        self.num_samples = 0
+        self.num_frames = 0
+        self.framer = _EnvelopeFramer(slicer, channels_last=channels_last)
+        # Buffered audio (in the original layout) starting from sample audio_start.
+        self.audio = []
+        self.audio_start = 0
+        # The last max_sil_kept + 1 RMS values before the current block.
+        self.recent = None
+        # State machine, same as in Slicer.slice().
+        self.silence_start = None
+        self.silence_head = None
+        self.clip_start = 0
+        # Clip emission state.
+        self.decided = False
+        self.num_tags = 0
+        self.last_end = 0
+        self.head_cut = False
+        # The first clip if the audio turns out to be silent from the start to the end, see _cut_long_silence().
+        self.leading = None
+        self.held_tags = []
+        self.chunks = []
+
+    def feed(self, block):
+        if self.keep_audio:
+            self.audio.append(block)
+        self.num_samples += block.shape[0 if self.channels_last else -1]
+        rms_list = self.framer.feed(block)
+        if self.recent is None:
+            self.recent = rms_list[:0]
+        if not self.decided and self.num_samples > self.slicer.min_length * self.slicer.hop_size:
+            self.decided = True
+            for tag in self.held_tags:
+                self._accept(*tag)
+            self.held_tags.clear()
+        with stage('state_machine'):
+            self._process(rms_list)
+        return self._pop_chunks()
+
+    def flush(self):
+        rms_list = self.framer.flush()
+        if rms_list is None:
+            # No block at all: a single empty clip, like slice() of an empty waveform
+            count('clips')
+            return [(0, 0) if not self.keep_audio else np.zeros(0, dtype=np.float32)]
+        with stage('state_machine'):
+            self._process(rms_list)
+        if not self.decided:
+            count('clips')
+            return [self._take_whole()]
+        # Deal with trailing silence.
+        total_frames = self.num_frames
+        silence_start = self.silence_start
+        if silence_start is not None:
+            count('silence_runs')
+        if silence_start is not None and total_frames - silence_start >= self.slicer.min_interval:
+            silence_end = min(total_frames, silence_start + self.slicer.max_sil_kept)
+            pos = self.silence_head[:silence_end + 1 - silence_start].argmin() + silence_start
+            self._accept(pos, total_frames + 1)
+        if self.num_tags == 0:
+            count('clips')
+            return [self._take_whole()]
+        if self.last_end < total_frames:
+            self.chunks.append(self._take(self.last_end, total_frames))
+        return self._pop_chunks()
+
+    def _process(self, rms_list):
+        if rms_list.shape[0] == 0:
+            return
+        count('frames', rms_list.shape[0])
+        max_sil_kept = self.slicer.max_sil_kept
+        offset = self.num_frames - self.recent.shape[0]
+        history = np.concatenate((self.recent, rms_list))
+        silent = rms_list < self.slicer.threshold
+        bounds = np.flatnonzero(silent[1:] != silent[:-1]) + 1
+        for begin, end in zip(np.r_[0, bounds], np.r_[bounds, silent.shape[0]]):
+            begin += self.num_frames
+            end += self.num_frames
+            if silent[begin - self.num_frames]:
+                # Record start of silent frames and keep the first max_sil_kept + 1 of them.
+                if self.silence_start is None:
+                    self.silence_start = begin
+                    self.silence_head = history[begin - offset: begin - offset + max_sil_kept + 1]
+                elif self.silence_head.shape[0] <= max_sil_kept:
+                    head_end = self.silence_start + max_sil_kept + 1
+                    self.silence_head = np.concatenate((self.silence_head, history[begin - offset: head_end - offset]))
                 continue
-            # Need slicing. Record the range of silent frames to be removed.
-            if i - silence_start <= self.max_sil_kept:
-                pos = rms_list[silence_start: i + 1].argmin() + silence_start
-                if silence_start == 0:
-                    sil_tags.append((0, pos))
-                else:
-                    sil_tags.append((pos, pos))
-                clip_start = pos
-            elif i - silence_start <= self.max_sil_kept * 2:
-                pos = rms_list[i - self.max_sil_kept: silence_start + self.max_sil_kept + 1].argmin()
-                pos += i - self.max_sil_kept
-                pos_l = rms_list[silence_start: silence_start + self.max_sil_kept + 1].argmin() + silence_start
-                pos_r = rms_list[i - self.max_sil_kept: i + 1].argmin() + i - self.max_sil_kept
-                if silence_start == 0:
-                    sil_tags.append((0, pos_r))
-                    clip_start = pos_r
-                else:
-                    sil_tags.append((min(pos_l, pos), max(pos_r, pos)))
-                    clip_start = max(pos_r, pos)
+            if self.silence_start is not None:
+                self._close_silence(begin, history, offset)
+        self.num_frames += rms_list.shape[0]
+        self.recent = history[-(max_sil_kept + 1):]
+        if self.silence_start is not None:
+            self._cut_long_silence()
+
+    def _close_silence(self, i, history, offset):
+        slicer = self.slicer
+        max_sil_kept = slicer.max_sil_kept
+        silence_start = self.silence_start
+        self.silence_start = None
+        count('silence_runs')
+        # Clear recorded silence start if interval is not enough or clip is too short
+        is_leading_silence = silence_start == 0 and i > max_sil_kept
+        need_slice_middle = i - silence_start >= slicer.min_interval and i - self.clip_start >= slicer.min_length
+        if not is_leading_silence and not need_slice_middle:
+            return
+        # Need slicing. Record the range of silent frames to be removed.
+        if i - silence_start <= max_sil_kept:
+            pos = history[silence_start - offset: i + 1 - offset].argmin() + silence_start
+            if silence_start == 0:
+                self._accept(0, pos)
             else:
-                pos_l = rms_list[silence_start: silence_start + self.max_sil_kept + 1].argmin() + silence_start
-                pos_r = rms_list[i - self.max_sil_kept: i + 1].argmin() + i - self.max_sil_kept
-                if silence_start == 0:
-                    sil_tags.append((0, pos_r))
-                else:
-                    sil_tags.append((pos_l, pos_r))
-                clip_start = pos_r
-            silence_start = None
-        # Deal with trailing silence.
-        total_frames = rms_list.shape[0]
-        if silence_start is not None and total_frames - silence_start >= self.min_interval:
-            silence_end = min(total_frames, silence_start + self.max_sil_kept)
-            pos = rms_list[silence_start: silence_end + 1].argmin() + silence_start
-            sil_tags.append((pos, total_frames + 1))
-        # Apply and return slices.
-        if len(sil_tags) == 0:
-            return [waveform]
+                self._accept(pos, pos)
+            self.clip_start = pos
+            return
+        pos_l = self.silence_head.argmin() + silence_start
+        pos_r = history[i - max_sil_kept - offset: i + 1 - offset].argmin() + i - max_sil_kept
+        if i - silence_start <= max_sil_kept * 2:
+            pos = history[i - max_sil_kept - offset: silence_start + max_sil_kept + 1 - offset].argmin()
+            pos += i - max_sil_kept
+            if silence_start == 0:
+                self._accept(0, pos_r)
+                self.clip_start = pos_r
+            else:
+                self._accept(min(pos_l, pos), max(pos_r, pos))
+                self.clip_start = max(pos_r, pos)
+        else:
+            if silence_start == 0:
+                self._accept(0, pos_r)
+            else:
+                self._accept(pos_l, pos_r)
+            self.clip_start = pos_r
+
+    def _cut_long_silence(self):
+        # Once a silence is longer than 2 * max_sil_kept and will be sliced whenever it ends, the clip before it
+        # ends at the minimum of its head, and only the last max_sil_kept frames of it can start the next clip.
+        # A leading silence longer than max_sil_kept is removed up to one of its last max_sil_kept frames when it
+        # ends. If it lasts until the end of the audio, the only clip ends at the minimum of its head, which is kept
+        # aside from the buffer.
+        slicer = self.slicer
+        silence_start = self.silence_start
+        length = self.num_frames - silence_start
+        if silence_start == 0:
+            if self.decided and length > slicer.max_sil_kept and length >= slicer.min_interval:
+                if self.leading is None:
+                    self.leading = self._take(0, self.silence_head.argmin())
+                self._discard((self.num_frames - slicer.max_sil_kept) * slicer.hop_size)
+            return
+        if (
+                not self.decided
+                or length <= slicer.max_sil_kept * 2 or length < slicer.min_interval
+                or self.num_frames - self.clip_start < slicer.min_length
+        ):
+            return
+        if not self.head_cut:
+            self._cut(self.silence_head.argmin() + silence_start)
+            self.head_cut = True
+        self._discard((self.num_frames - slicer.max_sil_kept) * slicer.hop_size)
+
+    def _accept(self, begin, end):
+        if not self.decided:
+            self.held_tags.append((begin, end))
+            return
+        if self.head_cut:
+            self.head_cut = False
         else:
-            chunks = []
-            if sil_tags[0][0] > 0:
-                chunks.append(self._apply_slice(waveform, 0, sil_tags[0][0]))
-            for i in range(len(sil_tags) - 1):
-                chunks.append(self._apply_slice(waveform, sil_tags[i][1], sil_tags[i + 1][0]))
-            if sil_tags[-1][1] < total_frames:
-                chunks.append(self._apply_slice(waveform, sil_tags[-1][1], total_frames))
-            return chunks
+            self._cut(begin)
+        self.leading = None
+        self.last_end = end
+        self._discard(end * self.slicer.hop_size)
+
+    def _cut(self, begin):
+        if self.num_tags > 0 or begin > 0:
+            self.chunks.append(self._take(self.last_end, begin) if self.leading is None else self.leading)
+        self.num_tags += 1
+
+    def _take(self, begin, end):
+        hop_size = self.slicer.hop_size
+        if not self.keep_audio:
+            return int(begin * hop_size), int(min(self.num_samples, end * hop_size))
+        begin = begin * hop_size - self.audio_start
+        end = min(self.num_samples, end * hop_size) - self.audio_start
+        audio = self._take_all()
+        self.audio = [audio]
+        return _slice_samples(audio, begin, end, self.channels_last).copy()
+
+    def _take_whole(self):
+        if not self.keep_audio:
+            return 0, self.num_samples
+        return self._take_all()
+
+    def _take_all(self):
+        if len(self.audio) > 1:
+            self.audio = [np.concatenate(self.audio, axis=0 if self.channels_last else -1)]
+        return self.audio[0]
+
+    def _discard(self, end):
+        if not self.keep_audio or end <= self.audio_start:
+            return
+        audio = self._take_all()
+        self.audio = [_slice_samples(audio, end - self.audio_start, None, self.channels_last)]
+        self.audio_start = min(end, self.num_samples)
+
+    def _pop_chunks(self):
+        count('clips', len(self.chunks))
+        chunks = self.chunks
+        self.chunks = []
+        return chunks
+
+
+# Dtypes that soundfile reads and writes losslessly for each subtype that can be copied without re-encoding.
+_COPY_DTYPES = {
+    'PCM_S8': 'int16',
+    'PCM_U8': 'int16',
+    'PCM_16': 'int16',
+    'PCM_24': 'int32',
+    'PCM_32': 'int32',
+    'FLOAT': 'float32',
+    'DOUBLE': 'float64',
+}
+_COPY_FORMATS = {'WAV', 'WAVEX', 'FLAC'}
+
+
+def load_audio(audio_path, sr=None, mono=True):
+    # Same as librosa.load(audio_path, sr=sr): a mono float32 waveform and its sample rate. The audio is decoded by
+    # soundfile, so librosa (and numba with it) is only imported to resample or to decode what libsndfile cannot.
+    # If not mono, multichannel audio is returned as read by soundfile, i.e. (samples, channels).
+    try:
+        with stage('decode'):
+            audio, source_sr = soundfile.read(audio_path, dtype='float32')
+    except RuntimeError:
+        import librosa
+        with stage('decode'):
+            audio, sr = librosa.load(audio_path, sr=sr, mono=mono)
+        return audio.T, sr
+    if mono and len(audio.shape) > 1:
+        with stage('downmix'):
+            audio = audio.mean(axis=1)
+    if sr is None or sr == source_sr:
+        return audio, source_sr
+    import librosa
+    with stage('resample'):
+        return librosa.resample(audio, orig_sr=source_sr, target_sr=sr, axis=0), sr
+
+
+def _to_mono(audio):
+    # Downmix of (samples, channels) audio, as librosa.load() does.
+    return audio.mean(axis=1) if len(audio.shape) > 1 else audio
+
+
+def _read_blocks(audio_path, sr, start=0, stop=None):
+    # Blocks of (samples, channels) audio, not downmixed, decoded by a background thread while the previous ones
+    # are being sliced.
+    return prefetch(_decode_blocks(audio_path, sr, start=start, stop=stop))
+
+
+def _decode_blocks(audio_path, sr, start=0, stop=None):
+    mapped = map_wav(audio_path)
+    if mapped is not None:
+        yield from mapped.blocks(sr * 10, start=start, stop=stop)
+        return
+    blocks = soundfile.blocks(audio_path, blocksize=sr * 10, dtype='float32', start=start, stop=stop)
+    while True:
+        with stage('decode'):
+            block = next(blocks, None)
+        if block is None:
+            return
+        yield block
+
+
+def _read_mono_blocks(audio_path, sr, start=0, stop=None):
+    # Downmix each block the same way librosa.load() does.
+    for block in _read_blocks(audio_path, sr, start=start, stop=stop):
+        with stage('downmix'):
+            yield _to_mono(block)
+
+
+def _get_level_stats(blocks, eps=1e-12):
+    # RMS and peak levels in dB of the samples of blocks. --stats passes the mono downmix of each clip (_to_mono()), as
+    # the clip is written.
+    square_sum = 0.
+    peak = 0.
+    num_samples = 0
+    for block in blocks:
+        if block.size == 0:
+            continue
+        square_sum += float(np.square(block, dtype=np.float64).sum())
+        peak = max(peak, float(np.abs(block).max()))
+        num_samples += block.size
+    rms = np.sqrt(square_sum / num_samples) if num_samples > 0 else 0.
+    return {
+        'rms_db': float(20 * np.log10(max(rms, eps))),
+        'peak_db': float(20 * np.log10(max(peak, eps)))
+    }
+
+
+def get_file_envelope(audio_path, slicer: Slicer, cache: EnvelopeCache = None, jobs=1):
+    # (rms_list, num_samples) of the file at its own sample rate, computed block by block, or from the cache.
+    # With jobs other than 1, memory-mapped files are split between threads by get_rms_parallel().
+    envelope = cache.get(audio_path, slicer) if cache is not None else None
+    mapped = map_wav(audio_path) if envelope is None and jobs != 1 else None
+    if mapped is not None:
+        envelope = slicer.get_rms_parallel(mapped, jobs=jobs), mapped.frames
+        if cache is not None:
+            cache.put(audio_path, slicer, *envelope)
+    elif envelope is None:
+        sr = soundfile.info(audio_path).samplerate
+        envelope = slicer.get_rms_stream(_read_blocks(audio_path, sr), channels_last=True)
+        if cache is not None:
+            cache.put(audio_path, slicer, *envelope)
+    return envelope
+
+
+def _get_file_boundaries(audio_path, slicer: Slicer, sr, cache: EnvelopeCache = None, jobs=1):
+    # Clip boundaries of the file, found by streaming over it, or from its cached or parallel envelope. The coarse to
+    # fine search reads memory-mapped files where needed instead of streaming over them.
+    if cache is None and slicer.search == 'coarse_to_fine':
+        mapped = map_wav(audio_path)
+        if mapped is not None and mapped.samplerate == sr:
+            return slicer.get_boundaries_from_rms(slicer.get_rms_sparse(mapped, jobs=jobs), mapped.frames)
+    if cache is None and jobs == 1:
+        return list(slicer.get_boundaries_stream(_read_blocks(audio_path, sr), channels_last=True))
+    return slicer.get_boundaries_from_rms(*get_file_envelope(audio_path, slicer, cache=cache, jobs=jobs))
+
+
+def can_copy_slices(audio_path):
+    info = soundfile.info(audio_path)
+    return info.format in _COPY_FORMATS and info.subtype in _COPY_DTYPES
+
+
+def copy_slices(audio_path, slicer: Slicer, out, block_size=65536, cache: EnvelopeCache = None, jobs=1, stem=None):
+    # Slice a WAV/FLAC file without re-encoding: the clip boundaries are found by streaming over the file (or from
+    # the envelope cache), then the frames of each clip are copied from the source in its own format and subtype,
+    # so that clips are bit-identical to the source and the file is never decoded as a whole. Clips are named
+    # <stem>_<i>.<ext>, see get_clip_stems().
+    with soundfile.SoundFile(audio_path) as source:
+        if source.format not in _COPY_FORMATS or source.subtype not in _COPY_DTYPES:
+            raise ValueError(f'Cannot copy slices from {source.format} ({source.subtype}) audio')
+        dtype = _COPY_DTYPES[source.subtype]
+        name = get_clip_stem(audio_path) if stem is None else stem
+        ext = os.path.basename(audio_path).rsplit('.', maxsplit=1)[-1]
+        os.makedirs(out, exist_ok=True)
+        num_chunks = 0
+        boundaries = _get_file_boundaries(audio_path, slicer, source.samplerate, cache=cache, jobs=jobs)
+        for i, (begin, end) in enumerate(boundaries):
+            with stage('encode'):
+                source.seek(begin)
+                with soundfile.SoundFile(
+                        os.path.join(out, f'%s_%d.%s' % (name, i, ext)), 'w', samplerate=source.samplerate,
+                        channels=source.channels, format=source.format, subtype=source.subtype, endian=source.endian
+                ) as target:
+                    for block in source.blocks(blocksize=block_size, frames=end - begin, dtype=dtype, always_2d=True):
+                        target.write(block)
+            num_chunks += 1
+    return num_chunks
+
+
+# Slicers of the current process, keyed by sample rate and parameters, so that batch workers build each of them only
+# once. Also used by sweep.py.
+_slicers = {}
+_caches = {}
+
+
+def _get_slicer(sr, slicer_kwargs):
+    key = (sr,) + tuple(sorted(slicer_kwargs.items()))
+    slicer = _slicers.get(key)
+    if slicer is None:
+        slicer = _slicers[key] = Slicer(sr=sr, **slicer_kwargs)
+    return slicer
+
+
+def _get_cache(cache_dir, max_bytes=1 << 30):
+    if cache_dir is None:
+        return None
+    cache = _caches.get((cache_dir, max_bytes))
+    if cache is None:
+        cache = _caches[cache_dir, max_bytes] = EnvelopeCache(cache_dir, max_bytes=max_bytes)
+    return cache
+
+
+def _decode_file(audio_path, slicer_kwargs, sr=None):
+    # With a channel policy other than 'mean', the channels are kept for the slicer and only downmixed clip by clip.
+    # Uncompressed WAV files are memory-mapped and decoded block by block as they are sliced.
+    mapped = map_wav(audio_path)
+    if mapped is not None and (sr is None or sr == mapped.samplerate):
+        return mapped, mapped.samplerate
+    return load_audio(audio_path, sr=sr, mono=slicer_kwargs.get('channel_policy', 'mean') == 'mean')
+
+
+def _slice_decoded(audio, sr, slicer_kwargs, jobs=1):
+    # Mono clips of audio returned by _decode_file(). Clips of a MappedWav are only decoded when written.
+    slicer = _get_slicer(sr, slicer_kwargs)
+    if isinstance(audio, MappedWav):
+        boundaries = _get_file_boundaries(audio.path, slicer, sr, jobs=jobs)
+        return (_to_mono(audio.read(begin, end)) for begin, end in boundaries)
+    return list(map(_to_mono, slicer.slice(audio, channels_last=True, jobs=jobs)))
+
+
+# libsndfile container format, default subtype and file extension of each output format.
+OUTPUT_FORMATS = {
+    'wav': ('WAV', 'PCM_16', 'wav'),
+    'flac': ('FLAC', 'PCM_16', 'flac'),
+    'ogg': ('OGG', 'VORBIS', 'ogg'),
+    'opus': ('OGG', 'OPUS', 'opus'),
+}
+
+
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def get_encoding(output_format='wav', subtype=None, sr=None, pack=None):
+    # How clips are encoded: an output format of OUTPUT_FORMATS, a libsndfile subtype (e.g. PCM_24 or FLOAT) and
+    # the sample rate the clips are resampled to, if any. Opus only supports _OPUS_RATES, so clips of other rates are
+    # resampled to 48 kHz for it anyway. With pack='tar', the clips of each file are packed into a single archive
+    # <name>.tar instead of being written as separate files (see archive.py).
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format: {output_format}')
+    if pack not in (None, 'tar'):
+        raise ValueError(f'Unknown archive format: {pack}')
+    container, default_subtype, _ = OUTPUT_FORMATS[output_format]
+    subtype = default_subtype if subtype is None else subtype.upper()
+    if not soundfile.check_format(container, subtype):
+        raise ValueError(f'libsndfile {soundfile.__libsndfile_version__} cannot write {subtype} {output_format} files')
+    return {'format': output_format, 'subtype': subtype, 'sr': sr, 'pack': pack}
+
+
+def get_clip_stem(audio_path):
+    return os.path.basename(audio_path).rsplit('.', maxsplit=1)[0]
+
+
+def get_clip_stems(audio_paths, out_dirs):
+    # Stem of the clip names of each file going to the corresponding output directory: its name without extension,
+    # unless other files going to the same directory have the same stem (e.g. x.wav and x.flac), in which case the
+    # extension is kept (x.wav_<i>.wav and x.flac_<i>.wav), and files of the same name from different directories
+    # are numbered, so that no file overwrites the clips of another.
+    from collections import Counter
+    dirs = [os.path.normcase(os.path.abspath(out_dir)) for out_dir in out_dirs]
+    stems = [get_clip_stem(path) for path in audio_paths]
+    counts = Counter(zip(dirs, stems))
+    stems = [
+        os.path.basename(path) if counts[(out_dir, stem)] > 1 else stem
+        for path, out_dir, stem in zip(audio_paths, dirs, stems)
+    ]
+    counts = Counter(zip(dirs, stems))
+    seen = Counter()
+    for i, (out_dir, stem) in enumerate(zip(dirs, stems)):
+        if counts[(out_dir, stem)] > 1:
+            seen[(out_dir, stem)] += 1
+            stems[i] = f'{stem}_{seen[(out_dir, stem)]}'
+    return stems
+
+
+def get_clip_names(audio_path, num_clips, copy=False, encoding=None, stem=None):
+    # File names of the clips written for the file, i.e. <stem>_<i>.wav (or the extension of the output format), or
+    # with the extension of the source if copied. Packed clips are all in <stem>.tar, if there is any clip.
+    name = get_clip_stem(audio_path) if stem is None else stem
+    if copy:
+        ext = os.path.basename(audio_path).rsplit('.', maxsplit=1)[-1]
+    else:
+        ext = OUTPUT_FORMATS[encoding['format'] if encoding is not None else 'wav'][2]
+        if encoding is not None and encoding['pack'] is not None:
+            return [f'{name}.{encoding["pack"]}'] if num_clips > 0 else []
+    return [f'%s_%d.%s' % (name, i, ext) for i in range(num_clips)]
+
+
+def _encode_clip(target, chunk, sr, encoding):
+    # Encodes the clip to target, a path or a file object.
+    target_sr = encoding['sr']
+    if target_sr is None and encoding['format'] == 'opus' and sr not in _OPUS_RATES:
+        target_sr = 48000
+    if target_sr is not None and target_sr != sr:
+        import librosa
+        with stage('resample'):
+            chunk = librosa.resample(chunk, orig_sr=sr, target_sr=target_sr, axis=0)
+        sr = target_sr
+    container, _, _ = OUTPUT_FORMATS[encoding['format']]
+    with stage('encode'):
+        soundfile.write(target, chunk, sr, format=container, subtype=encoding['subtype'])
+
+
+def _encode_clip_bytes(chunk, sr, encoding):
+    import io
+    buffer = io.BytesIO()
+    _encode_clip(buffer, chunk, sr, encoding)
+    return buffer.getvalue()
+
+
+# Threads of the current process encoding clips, so that encoding runs apart from slicing and several clips are
+# encoded at once, keyed by their number. libsndfile releases the GIL while encoding.
+_encoder_pools = {}
+
+
+def _get_encoder_pool(encoders):
+    pool = _encoder_pools.get(encoders)
+    if pool is None:
+        from concurrent.futures import ThreadPoolExecutor
+        pool = _encoder_pools[encoders] = ThreadPoolExecutor(max_workers=encoders)
+    return pool
+
+
+def _write_clips(chunks, out, audio_path, sr, encoding=None, encoders=1, stem=None):
+    # Clips are handed to encoders threads, at most two per thread at a time to bound the decoded audio kept around.
+    # Packed clips are encoded in memory and added to the archive in order by this thread.
+    if encoding is None:
+        encoding = get_encoding()
+    os.makedirs(out, exist_ok=True)
+    name = get_clip_stem(audio_path) if stem is None else stem
+    ext = OUTPUT_FORMATS[encoding['format']][2]
+    archive = None
+
+    def encode(i, chunk):
+        if encoding['pack'] is None:
+            return _encode_clip(os.path.join(out, f'%s_%d.%s' % (name, i, ext)), chunk, sr, encoding)
+        return _encode_clip_bytes(chunk, sr, encoding)
+
+    def write(i, data):
+        nonlocal archive
+        if encoding['pack'] is None:
+            return
+        if archive is None:
+            from archive import ArchiveWriter
+            archive = ArchiveWriter(os.path.join(out, f'{name}.{encoding["pack"]}'))
+        with stage('pack'):
+            archive.add(f'%s_%d.%s' % (name, i, ext), data)
+
+    from collections import deque
+    pending = deque()
+    num_chunks = 0
+    try:
+        for i, chunk in enumerate(chunks):
+            if encoders <= 1:
+                write(i, encode(i, chunk))
+            else:
+                if len(pending) >= 2 * encoders:
+                    write(num_chunks - len(pending), pending.popleft().result())
+                pending.append(_get_encoder_pool(encoders).submit(encode, i, chunk))
+            num_chunks += 1
+        while pending:
+            write(num_chunks - len(pending), pending.popleft().result())
+    finally:
+        for future in pending:
+            future.cancel()
+        if archive is not None:
+            archive.close()
+    return num_chunks
+
+
+def _slice_file(audio_path, out, slicer_kwargs, stream=False, copy=False, cache_dir=None, sr=None, jobs=1,
+                encoding=None, encoders=1, stem=None):
+    # sr resamples the audio before slicing; it cannot be used with stream or copy. Clips are written in mono,
+    # unless copied, and encoded as given by get_encoding(). jobs threads compute the envelope, except in stream mode.
+    # Sources that cannot be copied (see can_copy_slices()) are decoded and re-encoded instead.
+    if copy and can_copy_slices(audio_path):
+        slicer = _get_slicer(soundfile.info(audio_path).samplerate, slicer_kwargs)
+        return copy_slices(audio_path, slicer, out, cache=_get_cache(cache_dir), jobs=jobs, stem=stem)
+    if not stream:
+        audio, sr = _decode_file(audio_path, slicer_kwargs, sr=sr)
+        return _write_clips(
+            _slice_decoded(audio, sr, slicer_kwargs, jobs=jobs), out, audio_path, sr, encoding=encoding,
+            encoders=encoders, stem=stem
+        )
+    sr = soundfile.info(audio_path).samplerate
+    slicer = _get_slicer(sr, slicer_kwargs)
+    if slicer.channel_policy == 'mean':
+        chunks = slicer.slice_stream(_read_mono_blocks(audio_path, sr))
+    else:
+        chunks = map(_to_mono, slicer.slice_stream(_read_blocks(audio_path, sr), channels_last=True))
+    return _write_clips(chunks, out, audio_path, sr, encoding=encoding, encoders=encoders, stem=stem)
+
+
+def _get_entries(audio_path, boundaries, sr, clip_stats=None):
+    entries = []
+    for i, (begin, end) in enumerate(boundaries):
+        entry = {'audio': audio_path, 'clip': i, 'begin': begin, 'end': end, 'sr': sr}
+        if clip_stats is not None:
+            entry.update(clip_stats[i])
+        entries.append(entry)
+    return entries
+
+
+def _analyze_decoded(audio_path, audio, sr, slicer_kwargs, stats=False, jobs=1):
+    slicer = _get_slicer(sr, slicer_kwargs)
+    if isinstance(audio, MappedWav):
+        boundaries = _get_file_boundaries(audio_path, slicer, sr, jobs=jobs)
+        read = audio.read
+    else:
+        boundaries = slicer.get_boundaries(audio, channels_last=True, jobs=jobs)
+        read = lambda begin, end: audio[begin: end]
+    with stage('stats'):
+        clip_stats = [
+            _get_level_stats([_to_mono(read(begin, end))]) for begin, end in boundaries
+        ] if stats else None
+    return _get_entries(audio_path, boundaries, sr, clip_stats)
+
+
+def _analyze_file(audio_path, slicer_kwargs, stream=False, stats=False, cache_dir=None, sr=None, jobs=1):
+    # Manifest entries of the clips of the file, without writing any audio.
+    if not stream and cache_dir is None:
+        audio, sr = _decode_file(audio_path, slicer_kwargs, sr=sr)
+        return _analyze_decoded(audio_path, audio, sr, slicer_kwargs, stats=stats, jobs=jobs)
+    sr = soundfile.info(audio_path).samplerate
+    slicer = _get_slicer(sr, slicer_kwargs)
+    boundaries = _get_file_boundaries(
+        audio_path, slicer, sr, cache=_get_cache(cache_dir), jobs=1 if stream else jobs
+    )
+    clip_stats = [
+        _get_level_stats(_read_mono_blocks(audio_path, sr, start=begin, stop=end)) for begin, end in boundaries
+    ] if stats else None
+    return _get_entries(audio_path, boundaries, sr, clip_stats)
+
+
+# The batch runs each file through three stages, which overlap between consecutive files: _read_batch_item() decodes
+# the audio, _slice_batch_item() slices it, and _write_batch_item() encodes the clips. Files that are read block by
+# block (stream, copy and cached modes) are processed as a whole by the slicing stage. With a ledger, the reading stage
+# also skips the files that the ledger says are done, and the entries of the others go along with them.
+_SKIPPED = 'skipped'
+
+
+def _read_batch_item(item):
+    audio_path, out, slicer_kwargs, options, previous, _ = item
+    entry = None
+    copy = options['copy'] and can_copy_slices(audio_path)
+    if options['ledger_dir'] is not None:
+        from ledger import get_entry, is_done, remove_clips
+        # The backend and the search do not change the clips
+        params = {key: value for key, value in slicer_kwargs.items() if key not in ('backend', 'search')}
+        params.update(copy=copy, sr=options['sr'], encoding=options['encoding'])
+        entry = get_entry(audio_path, params, previous)
+        if options['resume'] and is_done(entry, previous, options['ledger_dir']):
+            return item, entry, _SKIPPED, None
+        remove_clips(previous, options['ledger_dir'], options['shared_clips'])
+    if options['stream'] or copy or (out is None and options['cache_dir'] is not None):
+        return item, entry, None, None
+    audio, sr = _decode_file(audio_path, slicer_kwargs, sr=options['sr'])
+    return item, entry, audio, sr
+
+
+def _slice_batch_item(task):
+    # (item, entry, clips to be written, sr), or (item, entry, number of clips or manifest entries, None) if nothing
+    # is left to write.
+    item, entry, audio, sr = task
+    audio_path, out, slicer_kwargs, options, previous, stem = item
+    if audio is _SKIPPED:
+        return item, entry, audio, None
+    if audio is None and out is None:
+        entries = _analyze_file(
+            audio_path, slicer_kwargs, stream=options['stream'], stats=options['stats'],
+            cache_dir=options['cache_dir'], sr=options['sr']
+        )
+        return item, entry, entries, None
+    if audio is None:
+        clips = _slice_file(
+            audio_path, out, slicer_kwargs, stream=options['stream'], copy=options['copy'],
+            cache_dir=options['cache_dir'], sr=options['sr'], encoding=options['encoding'],
+            encoders=options['encoders'], stem=stem
+        )
+        return item, entry, clips, None
+    if out is None:
+        return item, entry, _analyze_decoded(audio_path, audio, sr, slicer_kwargs, stats=options['stats']), None
+    return item, entry, _slice_decoded(audio, sr, slicer_kwargs), sr
+
+
+def _write_batch_item(task):
+    item, entry, value, sr = task
+    audio_path, out, _, options, previous, stem = item
+    if out is None:
+        return {'audio': audio_path, 'clips': len(value), 'error': None, 'entries': value}
+    if value is _SKIPPED:
+        # Packed files have a single archive but several clips
+        clips = previous.get('num_clips', len(previous['clips']))
+        return {'audio': audio_path, 'clips': clips, 'error': None, 'skipped': True, 'entry': entry}
+    if sr is not None:
+        value = _write_clips(
+            value, out, audio_path, sr, encoding=options['encoding'], encoders=options['encoders'], stem=stem
+        )
+    return {'audio': audio_path, 'clips': value, 'error': None, 'entry': entry}
+
+
+def slice_files(audio_paths, input_dir, out, slicer_kwargs, jobs=None, stream=False, copy=False, stats=False,
+                cache_dir=None, profiler=None, sr=None, queue_size=2, resume=True, encoding=None, encoders=1):
+    # Slice many files in a pool of worker processes, each of which pipelines decoding, slicing and encoding with at
+    # most queue_size files waiting between two stages. Clips of <input_dir>/<sub>/<name>.ext go to
+    # <out>/<sub>/<name>_<i>.wav, or into <out>/<sub>/<name>.tar if packed (with the stems of get_clip_stems(), so
+    # that x.wav and x.flac do not overwrite each other). If out is None, no audio is written and each result
+    # carries the manifest entries of the file instead. The profiles of all workers are merged into profiler, if
+    # given.
+    # Files sliced into out are recorded in its Ledger. If resume, files already sliced with the same content and
+    # parameters are skipped; the clips of the others are replaced. Clips are encoded as given by get_encoding() by
+    # encoders threads of each worker.
+    ledger = None
+    if out is not None:
+        from ledger import Ledger
+        ledger = Ledger(out)
+    options = {
+        'stream': stream, 'copy': copy, 'stats': stats, 'cache_dir': cache_dir, 'sr': sr,
+        'ledger_dir': None if ledger is None else out, 'resume': resume,
+        'shared_clips': set() if ledger is None else ledger.get_shared_clips(),
+        'encoding': get_encoding() if encoding is None else encoding, 'encoders': encoders
+    }
+    keys = [os.path.relpath(path, input_dir) for path in audio_paths]
+    out_dirs = [None if out is None else os.path.join(out, os.path.dirname(key)) for key in keys]
+    stems = get_clip_stems(audio_paths, [os.path.dirname(key) for key in keys])
+    items = [
+        (path, out_dir, slicer_kwargs, options, None if ledger is None else ledger.get(key), stem)
+        for path, key, out_dir, stem in zip(audio_paths, keys, out_dirs, stems)
+    ]
+    executor = PipelineExecutor(
+        [_read_batch_item, _slice_batch_item, _write_batch_item], jobs=jobs, size=queue_size, profiler=profiler
+    )
+    for index, result, error in executor.map(items):
+        if error is None and result.pop('skipped', False):
+            entry = result.pop('entry')
+            previous = items[index][4]
+            if (entry['size'], entry['mtime_ns']) != (previous['size'], previous['mtime_ns']):
+                # Touched but not changed, record the new mtime so that its content is not hashed again next time
+                ledger.record(keys[index], dict(entry, num_clips=result['clips']), previous['clips'])
+            print(f'{result["audio"]}: {result["clips"]} clips (already done)')
+        elif error is None:
+            if ledger is not None:
+                entry = result.pop('entry')
+                clips = get_clip_names(
+                    result['audio'], result['clips'], copy=entry['params']['copy'], encoding=options['encoding'],
+                    stem=items[index][5]
+                )
+                ledger.record(keys[index], dict(entry, num_clips=result['clips']), [
+                    os.path.relpath(os.path.join(items[index][1], clip), out) for clip in clips
+                ])
+            print(f'{result["audio"]}: {result["clips"]} clips')
+        else:
+            result = {'audio': items[index][0], 'clips': 0, 'error': error}
+            print(f'{result["audio"]}: failed ({result["error"]})')
+        yield result
+
+
+def _write_manifest(manifest, entries):
+    import json
+    os.makedirs(os.path.dirname(os.path.abspath(manifest)), exist_ok=True)
+    with open(manifest, 'w', encoding='utf8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
 
 
 def main():
     parser = ArgumentParser()
-    parser.add_argument('audio', type=str, help='The audio to be sliced')
+    parser.add_argument('audio', type=str, nargs='?', help='The audio to be sliced')
     parser.add_argument('--out', type=str, help='Output directory of the sliced audio clips')
+    parser.add_argument('--sr', type=int, required=False,
+                        help='Resample the audio to this sample rate before slicing, defaults to the original one')
+    parser.add_argument('--format', type=str, required=False, default='wav', choices=list(OUTPUT_FORMATS),
+                        help='Format of the sliced audio clips')
+    parser.add_argument('--subtype', type=str, required=False,
+                        help='Sample format of the clips, e.g. PCM_16, PCM_24 or FLOAT for WAV, defaults to PCM_16 for '
+                             'WAV and FLAC')
+    parser.add_argument('--out_sr', type=int, required=False,
+                        help='Resample each clip to this sample rate when writing it, defaults to the sample rate of the '
+                             'audio (or 48000 for Opus if the audio has a rate Opus does not support)')
+    parser.add_argument('--pack', type=str, required=False, choices=['tar'],
+                        help='Pack the clips of each audio file into a single archive <name>.tar (a WebDataset '
+                             'shard, see archive.py) instead of writing each clip to its own file')
+    parser.add_argument('--encoders', type=int, required=False, default=2,
+                        help='Number of threads encoding the clips, in each worker process')
     parser.add_argument('--db_thresh', type=float, required=False, default=-40,
                         help='The dB threshold for silence detection')
     parser.add_argument('--min_length', type=int, required=False, default=5000,
@@ -158,25 +1361,122 @@ def main():
                         help='Frame length in milliseconds')
     parser.add_argument('--max_sil_kept', type=int, required=False, default=500,
                         help='The maximum silence length kept around the sliced clip, presented in milliseconds')
+    parser.add_argument('--rms_method', type=str, required=False, default='strided', choices=['strided', 'sliding'],
+                        help='How RMS is computed: "strided" matches librosa, "sliding" runs in linear time')
+    parser.add_argument('--channel_policy', type=str, required=False, default='mean',
+                        help='How the channels of multichannel audio are combined for silence detection: "mean" of '
+                             'all channels, "max" for the loudest channel in each frame, or the index of a channel')
+    parser.add_argument('--backend', type=str, required=False, default='numpy', choices=list(BACKENDS),
+                        help='Engine of the silence detection state machine: "numba" compiles it (once, the compiled '
+                             'code is cached on disk) and falls back to "numpy" if numba is not installed')
+    parser.add_argument('--search', type=str, required=False, default='exhaustive', choices=list(SEARCHES),
+                        help='"coarse_to_fine" first rules out the frames that are clearly louder than the threshold '
+                             'from a quarter of the samples, then computes the RMS of the other frames only; the '
+                             'clips are the same')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read the audio block by block to keep memory usage bounded on long recordings')
+    parser.add_argument('--copy', action='store_true',
+                        help='Copy the clips from WAV/FLAC sources in their original format, subtype and channels '
+                             'instead of decoding and re-encoding the audio; other sources are still re-encoded')
+    parser.add_argument('--manifest', type=str, required=False,
+                        help='Write the clip boundaries to this JSON Lines file instead of writing any audio')
+    parser.add_argument('--stats', action='store_true',
+                        help='Include the RMS and peak levels of each clip in the manifest')
+    parser.add_argument('--cache_dir', type=str, required=False,
+                        help='Cache the RMS envelopes of the audio in this directory, so that re-slicing with other '
+                             'parameters skips decoding (only with --copy or --manifest)')
+    parser.add_argument('--input_dir', type=str, required=False,
+                        help='Slice all audio files in this directory instead of a single file')
+    parser.add_argument('--glob', type=str, required=False, default='*.wav',
+                        help='Pattern of the files to be sliced in the input directory, e.g. "**/*.flac"')
+    parser.add_argument('--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes used for the input directory, or of threads computing the '
+                             'envelope of a single file (except with --stream), defaults to the CPU count')
+    parser.add_argument('--prefetch', type=int, required=False, default=2,
+                        help='Number of files each worker decodes ahead of slicing, and keeps sliced ahead of '
+                             'encoding, in the input directory mode')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Slice all files in the input directory again, including those that the ledger in the '
+                             'output directory records as already sliced with the same content and parameters')
+    parser.add_argument('--summary', type=str, required=False,
+                        help='Path of the JSON summary of the input directory, defaults to <out>/summary.json')
+    parser.add_argument('--profile', type=str, required=False,
+                        help='Write the time spent in each stage (decode, rms, state_machine, encode, ...) and '
+                             'counters of frames, silence runs and clips to this JSON file')
     args = parser.parse_args()
-    out = args.out
-    if out is None:
-        out = os.path.dirname(os.path.abspath(args.audio))
-    import librosa
-    audio, sr = librosa.load(args.audio, sr=None)
-    slicer = Slicer(
-        sr=sr,
-        threshold=args.db_thresh,
-        min_length=args.min_length,
-        min_interval=args.min_interval,
-        hop_size=args.hop_size,
-        max_sil_kept=args.max_sil_kept
-    )
-    chunks = slicer.slice(audio)
-    if not os.path.exists(out):
-        os.makedirs(out)
-    for i, chunk in enumerate(chunks):
-        soundfile.write(os.path.join(out, f'%s_%d.wav' % (os.path.basename(args.audio).rsplit('.', maxsplit=1)[0], i)), chunk, sr)
+    if (args.audio is None) == (args.input_dir is None):
+        parser.error('Exactly one of audio and --input_dir must be specified')
+    if args.manifest is not None and args.copy:
+        parser.error('--manifest writes no audio and cannot be combined with --copy')
+    if args.channel_policy not in ('mean', 'max') and not args.channel_policy.isdigit():
+        parser.error('--channel_policy must be "mean", "max" or a channel index')
+    if args.cache_dir is not None and not args.copy and args.manifest is None:
+        parser.error('--cache_dir is only used with --copy or --manifest')
+    if args.sr is not None and (args.stream or args.copy or args.cache_dir is not None):
+        parser.error('--sr cannot be combined with --stream, --copy or --cache_dir')
+    if (args.copy or args.manifest is not None) and (
+            args.format != 'wav' or args.subtype is not None or args.out_sr is not None or args.pack is not None
+    ):
+        parser.error('--format, --subtype, --out_sr and --pack cannot be combined with --copy or --manifest')
+    try:
+        encoding = get_encoding(args.format, subtype=args.subtype, sr=args.out_sr, pack=args.pack)
+    except ValueError as e:
+        parser.error(str(e))
+    slicer_kwargs = {
+        'threshold': args.db_thresh,
+        'min_length': args.min_length,
+        'min_interval': args.min_interval,
+        'hop_size': args.hop_size,
+        'max_sil_kept': args.max_sil_kept,
+        'rms_method': args.rms_method,
+        'channel_policy': int(args.channel_policy) if args.channel_policy.isdigit() else args.channel_policy,
+        'backend': args.backend,
+        'search': args.search
+    }
+    if args.input_dir is not None:
+        import glob
+        import json
+        out = args.out
+        if out is None:
+            out = args.input_dir
+        audio_paths = sorted(glob.glob(os.path.join(args.input_dir, args.glob), recursive=True))
+        profiler = Profiler() if args.profile is not None else None
+        results = list(slice_files(
+            audio_paths, args.input_dir, out if args.manifest is None else None, slicer_kwargs,
+            jobs=args.jobs, stream=args.stream, copy=args.copy, stats=args.stats, cache_dir=args.cache_dir,
+            profiler=profiler, sr=args.sr, queue_size=args.prefetch, resume=not args.overwrite, encoding=encoding,
+            encoders=args.encoders
+        ))
+        if profiler is not None:
+            write_summary(args.profile, profiler)
+        if args.manifest is not None:
+            _write_manifest(args.manifest, [entry for result in results for entry in result.pop('entries', [])])
+        summary = args.summary
+        if summary is None:
+            summary = os.path.join(out, 'summary.json')
+        os.makedirs(os.path.dirname(os.path.abspath(summary)), exist_ok=True)
+        with open(summary, 'w', encoding='utf8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        failed = sum(result['error'] is not None for result in results)
+        print(f'{len(results) - failed} succeeded, {failed} failed')
+        return
+    from contextlib import nullcontext
+    with profile() if args.profile is not None else nullcontext() as profiler:
+        if args.manifest is not None:
+            _write_manifest(args.manifest, _analyze_file(
+                args.audio, slicer_kwargs, stream=args.stream, stats=args.stats, cache_dir=args.cache_dir, sr=args.sr,
+                jobs=args.jobs
+            ))
+        else:
+            out = args.out
+            if out is None:
+                out = os.path.dirname(os.path.abspath(args.audio))
+            _slice_file(
+                args.audio, out, slicer_kwargs, stream=args.stream, copy=args.copy, cache_dir=args.cache_dir,
+                sr=args.sr, jobs=args.jobs, encoding=encoding, encoders=args.encoders
+            )
+    if args.profile is not None:
+        write_summary(args.profile, profiler)
 
 
 if __name__ == '__main__':
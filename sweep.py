@@ -0,0 +1,286 @@
+import itertools
+import os.path
+import tempfile
+from argparse import ArgumentParser
+from contextlib import nullcontext
+
+import numpy as np
+
+from pipeline import PipelineExecutor
+
+# Clip lengths in seconds at which the histograms are split, by default.
+BINS = [0, 1, 2, 5, 10, 15, 20, 30, 60]
+# dB levels of the histogram of RMS frames that the automatic threshold is chosen from.
+DB_BINS = np.arange(-100, 0.5, 0.5)
+
+
+def get_configs(thresholds, min_lengths, min_intervals, hop_sizes, max_sil_kepts, rms_method='strided',
+                channel_policy='mean', backend='numpy'):
+    # Slicer kwargs of every combination of the values, leaving out those the slicer rejects.
+    from slicer2 import Slicer
+    configs = []
+    for threshold, min_length, min_interval, hop_size, max_sil_kept in itertools.product(
+            thresholds, min_lengths, min_intervals, hop_sizes, max_sil_kepts
+    ):
+        config = {
+            'threshold': threshold,
+            'min_length': min_length,
+            'min_interval': min_interval,
+            'hop_size': hop_size,
+            'max_sil_kept': max_sil_kept,
+            'rms_method': rms_method,
+            'channel_policy': channel_policy,
+            'backend': backend
+        }
+        try:
+            Slicer(sr=44100, **config)
+        except ValueError:
+            continue
+        configs.append(config)
+    return configs
+
+
+def get_auto_threshold(db_histogram):
+    # Threshold in dB that best separates the levels of the frames into silence and sound (Otsu's method), from
+    # their histogram over DB_BINS.
+    counts = np.asarray(db_histogram, dtype=np.float64)
+    levels = (DB_BINS[:-1] + DB_BINS[1:]) / 2
+    weights = np.cumsum(counts)
+    total = weights[-1]
+    if total == 0:
+        return None
+    sums = np.cumsum(counts * levels)
+    mean_below = sums / np.maximum(weights, 1)
+    mean_above = (sums[-1] - sums) / np.maximum(total - weights, 1)
+    variance = weights * (total - weights) * (mean_below - mean_above) ** 2
+    return float(DB_BINS[variance[:-1].argmax() + 1])
+
+
+# (key, EnvelopePyramid) of the last file of the current process. Tasks handle one file each, so only its pyramid
+# is kept in memory.
+_pyramid = None
+
+
+def _get_pyramid(audio_path, cache_dir, pyramid_hop, channel_policy):
+    # EnvelopePyramid of the file, kept in the cache directory.
+    global _pyramid
+    import hashlib
+    from envelope import get_file_pyramid
+    key = (audio_path, cache_dir, pyramid_hop, channel_policy)
+    if _pyramid is None or _pyramid[0] != key:
+        # Let go of the previous pyramid before building the next one
+        _pyramid = None
+        name = hashlib.sha1(os.path.realpath(audio_path).encode('utf8')).hexdigest() + '.pyramid.npz'
+        _pyramid = key, get_file_pyramid(
+            audio_path, hop_size=pyramid_hop, channel_policy=channel_policy, path=os.path.join(cache_dir, name)
+        )
+    return _pyramid[1]
+
+
+def _get_envelopes(audio_path, sr, configs, options):
+    # (rms_list, num_samples) of the file for each distinct hop and window size of the configs, from its pyramid if
+    # it has the envelope, or from the envelope cache if any.
+    from slicer2 import _get_cache, _get_slicer, get_file_envelope
+    envelopes = {}
+    for config in configs:
+        slicer = _get_slicer(sr, config)
+        key = (slicer.hop_size, slicer.win_size)
+        if key in envelopes:
+            continue
+        if options['pyramid_hop'] is not None:
+            pyramid = _get_pyramid(audio_path, options['pyramid_dir'], options['pyramid_hop'], slicer.channel_policy)
+            if pyramid.supports(slicer):
+                envelopes[key] = pyramid.get_rms(slicer), pyramid.num_samples
+                continue
+        cache = _get_cache(options['cache_dir'], max_bytes=options['cache_bytes'])
+        envelopes[key] = get_file_envelope(audio_path, slicer, cache=cache)
+    return envelopes
+
+
+def _evaluate_configs(sr, configs, envelopes, bins):
+    # Number of clips and histogram of their lengths for each config, from the envelopes of _get_envelopes().
+    from slicer2 import _get_slicer
+    results = []
+    for config in configs:
+        slicer = _get_slicer(sr, config)
+        boundaries = slicer.get_boundaries_from_rms(*envelopes[slicer.hop_size, slicer.win_size])
+        lengths = np.array([end - begin for begin, end in boundaries]) / sr
+        results.append({
+            'clips': len(boundaries),
+            'seconds': float(lengths.sum()),
+            'histogram': np.histogram(lengths, bins=bins + [np.inf])[0].tolist()
+        })
+    return results
+
+
+def _sweep_file(task):
+    # Computes the envelopes of the file once and keeps them in memory, and returns the sample rate, the histogram
+    # of the levels of the first envelope over DB_BINS and, if evaluate, the results of each config on the file.
+    import soundfile
+    audio_path, configs, options, evaluate = task
+    sr = soundfile.info(audio_path).samplerate
+    envelopes = _get_envelopes(audio_path, sr, configs, options)
+    rms_list, _ = next(iter(envelopes.values()))
+    levels = 20 * np.log10(np.maximum(rms_list, 1e-10))
+    db_histogram = np.histogram(np.clip(levels, DB_BINS[0], DB_BINS[-1]), bins=DB_BINS)[0]
+    return sr, db_histogram, _evaluate_configs(sr, configs, envelopes, options['bins']) if evaluate else None
+
+
+def _evaluate(task):
+    # Results of each config on the file, from the envelopes that _sweep_file() put into the cache (computed again
+    # if they were evicted in the meantime).
+    audio_path, sr, configs, options = task
+    return _evaluate_configs(sr, configs, _get_envelopes(audio_path, sr, configs, options), options['bins'])
+
+
+def sweep(audio_paths, configs, jobs=None, cache_dir=None, bins=None, auto_threshold=False, pyramid_hop=None,
+          cache_bytes=None):
+    # Evaluates every config on every file, computing the envelope of each file only once per hop and window size:
+    # the workers compute the envelopes of a file and slice it with every config while they are in memory. With
+    # cache_dir, the envelopes are also put into an EnvelopeCache there, for later sweeps and slicer2.py
+    # --cache_dir. With auto_threshold, configs are evaluated at the threshold chosen by get_auto_threshold() from
+    # the levels of all files instead of their own thresholds: all envelopes are first put into the cache (a
+    # temporary one if cache_dir is None), then the files are sliced in a second pass. The cache is limited to
+    # cache_bytes; by default it keeps the envelopes of all files.
+    # With pyramid_hop (in milliseconds), the envelopes of all hop sizes that are multiples of it are summed from a
+    # single EnvelopePyramid of each file, which gives the envelopes of rms_method='sliding'.
+    # Returns the results of each config and the automatic threshold, if any.
+    bins = list(BINS if bins is None else bins)
+    temporary = cache_dir is None and (auto_threshold or pyramid_hop is not None)
+    with tempfile.TemporaryDirectory() if temporary else nullcontext(cache_dir) as work_dir:
+        options = {
+            'cache_dir': work_dir if cache_dir is not None or auto_threshold else None, 'cache_bytes': cache_bytes,
+            'pyramid_dir': work_dir, 'pyramid_hop': pyramid_hop, 'bins': bins
+        }
+        samplerates = {}
+        db_histogram = np.zeros(DB_BINS.shape[0] - 1, dtype=np.int64)
+        file_results = {}
+        tasks = [(path, configs, options, not auto_threshold) for path in audio_paths]
+        for index, value, error in PipelineExecutor([_sweep_file], jobs=jobs).map(tasks):
+            if error is not None:
+                print(f'{audio_paths[index]}: failed ({error})')
+                continue
+            samplerates[audio_paths[index]] = value[0]
+            db_histogram += value[1]
+            if value[2] is not None:
+                file_results[audio_paths[index]] = value[2]
+
+        threshold = None
+        if auto_threshold:
+            threshold = get_auto_threshold(db_histogram)
+            if threshold is not None:
+                configs = list({
+                    tuple(sorted(dict(config, threshold=threshold).items())): dict(config, threshold=threshold)
+                    for config in configs
+                }.values())
+            tasks = [(path, sr, configs, options) for path, sr in samplerates.items()]
+            for index, value, error in PipelineExecutor([_evaluate], jobs=jobs).map_unordered(tasks):
+                if error is not None:
+                    print(f'{tasks[index][0]}: failed ({error})')
+                    continue
+                file_results[tasks[index][0]] = value
+
+    results = [
+        {'config': config, 'files': 0, 'clips': 0, 'seconds': 0., 'histogram': [0] * len(bins)}
+        for config in configs
+    ]
+    for value in file_results.values():
+        for result, file_result in zip(results, value):
+            result['files'] += 1
+            result['clips'] += file_result['clips']
+            result['seconds'] += file_result['seconds']
+            result['histogram'] = [a + b for a, b in zip(result['histogram'], file_result['histogram'])]
+    return results, threshold
+
+
+def _format_bins(bins):
+    return [f'{begin}-{end}s' for begin, end in zip(bins, bins[1:])] + [f'{bins[-1]}s+']
+
+
+def main():
+    parser = ArgumentParser(description='Evaluate a grid of slicing parameters on audio files, computing the RMS '
+                                        'envelope of each file only once')
+    parser.add_argument('audio', type=str, nargs='*', help='The audio files to be evaluated')
+    parser.add_argument('--input_dir', type=str, required=False,
+                        help='Evaluate all audio files in this directory as well')
+    parser.add_argument('--glob', type=str, required=False, default='*.wav',
+                        help='Pattern of the files to be evaluated in the input directory, e.g. "**/*.flac"')
+    parser.add_argument('--db_thresh', type=float, nargs='+', required=False, default=[-40],
+                        help='The dB thresholds for silence detection')
+    parser.add_argument('--min_length', type=int, nargs='+', required=False, default=[5000],
+                        help='The minimum milliseconds required for each sliced audio clip')
+    parser.add_argument('--min_interval', type=int, nargs='+', required=False, default=[300],
+                        help='The minimum milliseconds for a silence part to be sliced')
+    parser.add_argument('--hop_size', type=int, nargs='+', required=False, default=[10],
+                        help='Frame length in milliseconds')
+    parser.add_argument('--max_sil_kept', type=int, nargs='+', required=False, default=[500],
+                        help='The maximum silence length kept around the sliced clip, presented in milliseconds')
+    parser.add_argument('--rms_method', type=str, required=False, default='strided', choices=['strided', 'sliding'],
+                        help='How RMS is computed: "strided" matches librosa, "sliding" runs in linear time')
+    parser.add_argument('--channel_policy', type=str, required=False, default='mean',
+                        help='How the channels of multichannel audio are combined for silence detection: "mean" of '
+                             'all channels, "max" for the loudest channel in each frame, or the index of a channel')
+    parser.add_argument('--backend', type=str, required=False, default='numpy', choices=['numpy', 'numba'],
+                        help='Engine of the silence detection state machine, see slicer2.py --backend')
+    parser.add_argument('--auto_threshold', action='store_true',
+                        help='Choose the threshold from the distribution of the frame levels of all files instead '
+                             'of --db_thresh')
+    parser.add_argument('--bins', type=float, nargs='+', required=False, default=BINS,
+                        help='Clip lengths in seconds at which the clip length histograms are split')
+    parser.add_argument('--jobs', type=int, required=False, default=None,
+                        help='Number of worker processes, defaults to the CPU count')
+    parser.add_argument('--cache_dir', type=str, required=False,
+                        help='Keep the RMS envelopes in this directory, so that later sweeps and slicer2.py '
+                             '--cache_dir skip decoding')
+    parser.add_argument('--cache_bytes', type=int, required=False,
+                        help='Limit of the size of the envelope cache in bytes, by default the envelopes of all files '
+                             'are kept')
+    parser.add_argument('--pyramid_hop', type=int, required=False,
+                        help='Compute a single energy pyramid of each file with this hop in milliseconds, and sum the '
+                             'envelopes of all hop sizes that are multiples of it from there (requires --rms_method '
+                             'sliding)')
+    parser.add_argument('--out', type=str, required=False, help='Write the results to this JSON file')
+    args = parser.parse_args()
+    if args.pyramid_hop is not None and args.rms_method != 'sliding':
+        parser.error('--pyramid_hop gives the envelopes of --rms_method sliding only')
+    if args.channel_policy not in ('mean', 'max') and not args.channel_policy.isdigit():
+        parser.error('--channel_policy must be "mean", "max" or a channel index')
+    audio_paths = list(args.audio)
+    if args.input_dir is not None:
+        import glob
+        audio_paths += sorted(glob.glob(os.path.join(args.input_dir, args.glob), recursive=True))
+    if len(audio_paths) == 0:
+        parser.error('No audio files to be evaluated')
+    configs = get_configs(
+        args.db_thresh, args.min_length, args.min_interval, args.hop_size, args.max_sil_kept,
+        rms_method=args.rms_method,
+        channel_policy=int(args.channel_policy) if args.channel_policy.isdigit() else args.channel_policy,
+        backend=args.backend
+    )
+    if len(configs) == 0:
+        parser.error('No valid configs: min_length >= min_interval >= hop_size and max_sil_kept >= hop_size must '
+                     'be satisfied')
+
+    results, threshold = sweep(
+        audio_paths, configs, jobs=args.jobs, cache_dir=args.cache_dir, bins=args.bins,
+        auto_threshold=args.auto_threshold, pyramid_hop=args.pyramid_hop, cache_bytes=args.cache_bytes
+    )
+    if args.auto_threshold:
+        print(f'Automatic threshold: {threshold} dB')
+    print('db_thresh  min_length  min_interval  hop_size  max_sil_kept  clips  mean_length  ' +
+          '  '.join(_format_bins(args.bins)))
+    for result in results:
+        config = result['config']
+        mean_length = result['seconds'] / result['clips'] if result['clips'] > 0 else 0.
+        print('%9g  %10d  %12d  %8d  %12d  %5d  %10.2fs  ' % (
+            config['threshold'], config['min_length'], config['min_interval'], config['hop_size'],
+            config['max_sil_kept'], result['clips'], mean_length
+        ) + '  '.join(str(n) for n in result['histogram']))
+    if args.out is not None:
+        import json
+        with open(args.out, 'w', encoding='utf8') as f:
+            json.dump({'auto_threshold': threshold, 'bins': args.bins, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import os
+import struct
+
+import numpy as np
+
+from profiler import stage
+
+# Subformat GUID of WAVE_FORMAT_EXTENSIBLE, following its 2-byte format tag.
+_WAV_GUID_TAIL = b'\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+
+class MappedWav:
+    # Samples of an uncompressed little-endian WAV file, memory-mapped instead of decoded. read() and blocks() convert
+    # the raw samples to float32 exactly like soundfile.read(), but only the frames asked for, so that the file is
+    # never copied as a whole and processes slicing the same file share its pages in the OS page cache.
+    # Raises ValueError for anything else than 8/16/24/32-bit PCM or 32/64-bit float WAV.
+    def __init__(self, audio_path):
+        self.path = audio_path
+        with open(audio_path, 'rb') as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] != b'RIFF' or header[8:] != b'WAVE':
+                raise ValueError(f'Not a RIFF WAV file: {audio_path}')
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    raise ValueError(f'No data chunk in {audio_path}')
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+                if chunk_id == b'data':
+                    break
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size)
+                    f.seek(chunk_size & 1, 1)
+                else:
+                    f.seek(chunk_size + (chunk_size & 1), 1)
+            offset = f.tell()
+            file_size = os.fstat(f.fileno()).st_size
+        if fmt is None or len(fmt) < 16:
+            raise ValueError(f'No format chunk before the data of {audio_path}')
+        tag, self.channels, self.samplerate, _, block_align, _ = struct.unpack('<HHIIHH', fmt[:16])
+        if tag == 0xFFFE and len(fmt) >= 40 and fmt[26:40] == _WAV_GUID_TAIL:
+            tag = struct.unpack('<H', fmt[24:26])[0]
+        width = block_align // self.channels if self.channels > 0 else 0
+        if block_align != width * self.channels or (tag, width) not in (
+                (1, 1), (1, 2), (1, 3), (1, 4), (3, 4), (3, 8)
+        ):
+            raise ValueError(f'Cannot memory-map WAV data of format {tag} with {block_align} bytes per frame')
+        # Streamed WAV files may not have the final size in their header.
+        if chunk_size == 0 or chunk_size == 0xFFFFFFFF:
+            chunk_size = file_size - offset
+        self.frames = min(chunk_size, file_size - offset) // block_align
+        self.is_float = tag == 3
+        self.width = width
+        dtype = {1: np.uint8, 2: np.int16, 3: np.uint8, 4: np.int32}[width] if not self.is_float \
+            else {4: np.float32, 8: np.float64}[width]
+        shape = (self.frames, self.channels, 3) if width == 3 else (self.frames, self.channels)
+        self.data = np.memmap(audio_path, dtype=np.dtype(dtype).newbyteorder('<'), mode='r', offset=offset,
+                              shape=shape) if self.frames > 0 else np.zeros(shape, dtype=dtype)
+
+    def read(self, start=0, stop=None, step=1):
+        # float32 frames [start, stop), (samples,) for mono or (samples, channels) like soundfile.read(), or every
+        # step-th of them. Float32 data is returned as a read-only view of the map.
+        raw = self.data[start: stop: step]
+        with stage('decode'):
+            if self.is_float:
+                audio = raw if raw.dtype == np.float32 else raw.astype(np.float32)
+            elif self.width == 1:
+                audio = (raw.astype(np.float32) - 128) * np.float32(1 / 0x80)
+            elif self.width == 2:
+                audio = raw.astype(np.float32) * np.float32(1 / 0x8000)
+            else:
+                if self.width == 3:
+                    raw = raw.astype(np.int32)
+                    raw = (raw[..., 0] << 8) | (raw[..., 1] << 16) | (raw[..., 2] << 24)
+                audio = raw.astype(np.float32) * np.float32(1 / 0x80000000)
+        return audio[:, 0] if self.channels == 1 else audio
+
+    def blocks(self, block_size, start=0, stop=None):
+        stop = self.frames if stop is None else min(stop, self.frames)
+        for begin in range(start, stop, block_size):
+            yield self.read(begin, min(begin + block_size, stop))
+
+
+def map_wav(audio_path):
+    # MappedWav of the file, or None if it cannot be memory-mapped.
+    try:
+        return MappedWav(audio_path)
+    except (OSError, ValueError):
+        return None